@@ -2,23 +2,67 @@ import pandas as pd
 import numpy as np
 
 import dash
-import dash_core_components as dcc
-import dash_html_components as html
-import dash_table as dt
+from dash import dcc, html
+from dash import dash_table as dt
 from dash.dependencies import Input, Output, State
+from flask_compress import Compress
 import plotly.graph_objects as go
-import plotly.express as px
 import datetime
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+
+import cache
+import cache_backends
+import fetch
+import health
+import metrics
+import profiling
+import static_assets
+import timeseries
+import warmup
 
-external_stylesheets = [
-    "https://codepen.io/unicorndy/pen/GRJXrvP.css",
-    "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/4.7.0/css/font-awesome.min.css",
-]
+#############################################################################
+# Wall time of each data preprocessing stage at import, read by the benchmarks
+#############################################################################
+stage_times = {}
+_stage_started = [time.perf_counter()]
+
+
+def end_stage(name, started=_stage_started):
+    # `started`: the timer of the thread running the stages
+    now = time.perf_counter()
+    stage_times[name] = now - started[0]
+    started[0] = now
+
+
+# SELF_HOSTED_ASSETS=1 renders without any third-party request: the page uses
+# the grid stylesheet bundled in assets/ and a map style without tiles
+self_hosted_assets = os.environ.get("SELF_HOSTED_ASSETS", "0") == "1"
+
+external_stylesheets = ["https://codepen.io/unicorndy/pen/GRJXrvP.css"]
+if self_hosted_assets:
+    external_stylesheets = []
 
 app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
 app.title = "Covid - 19 Dashboard"
 
 server = app.server
+# Compress the layout and callback JSON. Registered before every other
+# after_request hook so it runs last, on the final body. Static assets are left
+# alone: compressing plotly.js again on every page load costs more than it saves.
+server.config.update(
+    COMPRESS_MIMETYPES=["application/json"],
+    COMPRESS_ALGORITHM=["br", "gzip"],
+    COMPRESS_MIN_SIZE=1024,
+    COMPRESS_LEVEL=6,
+    COMPRESS_BR_LEVEL=4,
+)
+Compress(server)
 
 colors = {
     "background": "#2D2D2D",
@@ -46,469 +90,560 @@ boxBorderStyle = {
 url_confirmed = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_confirmed_global.csv"
 url_deaths = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_deaths_global.csv"
 url_recovered = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_recovered_global.csv"
+url_confirmed_us = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_confirmed_US.csv"
+url_deaths_us = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_deaths_US.csv"
+
+# US_COUNTIES=1 also loads the US county files (timeseries.read_us), whose
+# counties replace the national "US" rows of confirmed and deaths
+us_counties = os.environ.get("US_COUNTIES", "0") == "1"
+sources = [url_confirmed, url_deaths, url_recovered]
+readers = [timeseries.read] * 3
+if us_counties:
+    sources += [url_confirmed_us, url_deaths_us]
+    readers += [timeseries.read_us] * 2
+
+# Set COVID_DATA_DIR to a directory holding the same CSV files to run offline,
+# or COVID_DATA_URL to another server with the same file names
+data_dir = os.environ.get("COVID_DATA_DIR")
+data_url = os.environ.get("COVID_DATA_URL")
+
+
+def source(url):
+    if data_dir:
+        return os.path.join(data_dir, url.rsplit("/", 1)[-1])
+    if data_url:
+        return data_url.rstrip("/") + "/" + url.rsplit("/", 1)[-1]
+    return url
+
+
+end_stage("dash_app")
+
+
+# The KPIs, leaderboards, map and table need only the last two days: each file is
+# downloaded whole (fetch.py) but only its metadata and LATEST_DAYS trailing
+# columns are parsed at import. The full history is parsed from the same bytes
+# on a background thread (load_history below).
+LATEST_DAYS = 2
+# The county files are published separately and may be a few days ahead of or
+# behind the global ones: a week more of them is parsed, so with_counties finds
+# the global latest days among them
+COUNTY_MARGIN_DAYS = 7
+
+
+def latest_reader(read, last=LATEST_DAYS):
+    def read_latest(stream):
+        # parsed while it downloads, the bytes are kept for the history
+        tee = fetch.Tee(stream)
+        frame = read(tee, last=last)
+        return tee.getvalue(), frame
+
+    return read_latest
+
+
+def column_date(name):
+    return datetime.datetime.strptime(name, "%m/%d/%y")
+
+
+# Counties in place of the country's rows of `df`, on the same date columns. The
+# dates of both files are aligned in calendar order: a county file lagging
+# behind repeats its last count, one ahead has its extra days dropped, and
+# days before its first column count 0. Recovered has no county file and keeps
+# its national row, so the US recovered total still counts in the country
+# rollups while the counties show none.
+def with_counties(df, counties):
+    if list(counties.columns) != list(df.columns):
+        dates = sorted(set(counties.columns[4:]) | set(df.columns[4:]), key=column_date)
+        counts = (
+            counties.iloc[:, 4:]
+            .reindex(columns=dates)
+            .ffill(axis=1)[df.columns[4:]]
+            .fillna(0)
+            .astype(np.int32)
+        )
+        counties = pd.concat([counties.iloc[:, :4], counts], axis=1)
+    country = counties["Country/Region"].iloc[0]
+    df = pd.concat([df[df["Country/Region"] != country], counties], ignore_index=True)
+    for name in ("Province/State", "Country/Region"):
+        df[name] = df[name].astype(object).astype("category")
+    return df
+
+
+def combine(frames):
+    confirmed, deaths, recovered = frames[:3]
+    if len(frames) > 3:
+        confirmed = with_counties(confirmed, frames[3])
+        deaths = with_counties(deaths, frames[4])
+    return confirmed, deaths, recovered
+
+
+raw_csvs, latest_frames = zip(
+    *fetch.read_all(
+        [source(url) for url in sources],
+        [latest_reader(read) for read in readers[:3]]
+        + [
+            latest_reader(read, LATEST_DAYS + COUNTY_MARGIN_DAYS)
+            for read in readers[3:]
+        ],
+        retries=int(os.environ.get("FETCH_RETRIES", "3")),
+    )
+)
+# A county file more than COUNTY_MARGIN_DAYS ahead has none of the global latest
+# days among its parsed columns, and would count 0 on them: it is parsed whole
+latest_frames = list(latest_frames)
+for i in range(3, len(latest_frames)):
+    if column_date(latest_frames[i].columns[4]) > column_date(
+        latest_frames[0].columns[4]
+    ):
+        latest_frames[i] = readers[i](io.BytesIO(raw_csvs[i]))
+# df_confirmed, df_deaths and df_recovered hold the trailing LATEST_DAYS columns
+df_confirmed, df_deaths, df_recovered = combine(latest_frames)
+end_stage("read_csv")
+
+# Identifies the loaded data; cached callback responses are keyed by it
+data_version = hashlib.sha1()
+for raw in raw_csvs:
+    data_version.update(hashlib.sha1(raw).digest())
+data_version = data_version.hexdigest()[:12]
+latest_date = pd.to_datetime(df_confirmed.columns[-1], format="%m/%d/%y")
+end_stage("data_version")
+
+
+# "Province|Country" key with "nann" for a missing province, built without leaving
+# the categorical dtype of the name columns
+def location_key(df):
+    province = df["Province/State"].cat.add_categories("nann").fillna("nann")
+    return province.astype(str) + "|" + df["Country/Region"].astype(str)
+
+
+# Row order used by the table and the single country graphs: highest latest
+# confirmed count first, with India moved to the top
+def india_first_order(latest, names):
+    order = np.argsort(-np.asarray(latest), kind="stable")
+    india = np.asarray(names)[order] == "India"
+    return np.concatenate([order[india], order[~india]])
 
-df_confirmed = pd.read_csv(url_confirmed)
-df_deaths = pd.read_csv(url_deaths)
-df_recovered = pd.read_csv(url_recovered)
 
+######## Data Pre-processing ###############
+# Every step below runs on the latest days at import, and again on the full
+# history in load_history()
 
-def df_move1st_sg(df_t):
-    df_t["new"] = range(1, len(df_t) + 1)
-    df_t.loc[df_t[df_t["Country/Region"] == "India"].index.values, "new"] = 0
-    df_t = df_t.sort_values("new").drop("new", axis=1)
-    return df_t
 
+# Total cases, dated once here: the figure builders never modify the module-level data
+def daily_totals(df):
+    total = df.iloc[:, 4:].sum(axis=0)
+    total.index = pd.to_datetime(total.index, format="%m/%d/%y")
+    return total
 
-######## Data Pre-processing ###############
 
-# Total cases
-df_confirmed_total = df_confirmed.iloc[:, 4:].sum(axis=0)
-df_deaths_total = df_deaths.iloc[:, 4:].sum(axis=0)
-df_recovered_total = df_recovered.iloc[:, 4:].sum(axis=0)
-
-# modified deaths dataset for mortality rate calculation
-df_deaths_confirmed = df_deaths.copy()
-df_deaths_confirmed["confirmed"] = df_confirmed.iloc[:, -1]
-
-# Sorted - df_deaths_confirmed_sorted is different from others, as it is only modified later. Careful of it dataframe structure
-df_deaths_confirmed_sorted = df_deaths_confirmed.sort_values(
-    by=df_deaths_confirmed.columns[-2], ascending=False
-)[["Country/Region", df_deaths_confirmed.columns[-2], df_deaths_confirmed.columns[-1]]]
-df_recovered_sorted = df_recovered.sort_values(
-    by=df_recovered.columns[-1], ascending=False
-)[["Country/Region", df_recovered.columns[-1]]]
-df_confirmed_sorted = df_confirmed.sort_values(
-    by=df_confirmed.columns[-1], ascending=False
-)[["Country/Region", df_confirmed.columns[-1]]]
-
-# Single day increase
-df_deaths_confirmed_sorted["24hr"] = (
-    df_deaths_confirmed_sorted.iloc[:, -2]
-    - df_deaths.sort_values(by=df_deaths.columns[-1], ascending=False)[
-        df_deaths.columns[-2]
-    ]
-)
-df_recovered_sorted["24hr"] = (
-    df_recovered_sorted.iloc[:, -1]
-    - df_recovered.sort_values(by=df_recovered.columns[-1], ascending=False)[
-        df_recovered.columns[-2]
-    ]
-)
-df_confirmed_sorted["24hr"] = (
-    df_confirmed_sorted.iloc[:, -1]
-    - df_confirmed.sort_values(by=df_confirmed.columns[-1], ascending=False)[
-        df_confirmed.columns[-2]
-    ]
-)
+# the KPIs only read the last two values; load_history() replaces these
+df_confirmed_total = daily_totals(df_confirmed)
+df_deaths_total = daily_totals(df_deaths)
+df_recovered_total = daily_totals(df_recovered)
+end_stage("totals")
 
-# Aggregate the countries with different province/state together
-df_deaths_confirmed_sorted_total = df_deaths_confirmed_sorted.groupby(
-    "Country/Region"
-).sum()
-df_deaths_confirmed_sorted_total = df_deaths_confirmed_sorted_total.sort_values(
-    by=df_deaths_confirmed_sorted_total.columns[0], ascending=False
-).reset_index()
-df_recovered_sorted_total = df_recovered_sorted.groupby("Country/Region").sum()
-df_recovered_sorted_total = df_recovered_sorted_total.sort_values(
-    by=df_recovered_sorted_total.columns[0], ascending=False
-).reset_index()
-df_confirmed_sorted_total = df_confirmed_sorted.groupby("Country/Region").sum()
-df_confirmed_sorted_total = df_confirmed_sorted_total.sort_values(
-    by=df_confirmed_sorted_total.columns[0], ascending=False
-).reset_index()
 
 # Modified recovery csv due to difference in number of rows. Recovered will match ['Province/State','Country/Region']column with Confirmed ['Province/State','Country/Region']
-df_recovered["Province+Country"] = (
-    df_recovered[["Province/State", "Country/Region"]]
-    .fillna("nann")
-    .agg("|".join, axis=1)
-)
-df_confirmed["Province+Country"] = (
-    df_confirmed[["Province/State", "Country/Region"]]
-    .fillna("nann")
-    .agg("|".join, axis=1)
-)
-df_recovered_fill = df_recovered
-df_recovered_fill.set_index("Province+Country")
-df_recovered_fill.set_index("Province+Country").reindex(
-    df_confirmed["Province+Country"]
-)
-df_recovered_fill = (
-    df_recovered_fill.set_index("Province+Country")
-    .reindex(df_confirmed["Province+Country"])
-    .reset_index()
-)
+# Rows missing from recovered become NaN, so the filled counts are float64
+# (float32 would round counts above 2**24)
+def recovered_fill(df_recovered, df_confirmed):
+    counts = (
+        df_recovered.set_index(location_key(df_recovered))
+        .drop(["Province/State", "Country/Region", "Lat", "Long"], axis=1)
+        .reindex(location_key(df_confirmed))
+        .reset_index(drop=True)
+    )
+    # take the name and coordinate columns from confirmed, which the rows now line up with
+    return pd.concat(
+        [df_confirmed[["Province/State", "Country/Region", "Lat", "Long"]], counts],
+        axis=1,
+    )
 
-# split Province+Country back into its respective columns
-new = df_recovered_fill["Province+Country"].str.split("|", n=1, expand=True)
-df_recovered_fill["Province/State"] = new[0]
-df_recovered_fill["Country/Region"] = new[1]
-df_recovered_fill["Province/State"].replace("nann", "NaN")
 
-# drop 'Province+Country' for all dataset
-df_confirmed.drop("Province+Country", axis=1, inplace=True)
-df_recovered.drop("Province+Country", axis=1, inplace=True)
-df_recovered_fill.drop("Province+Country", axis=1, inplace=True)
+df_recovered_fill = recovered_fill(df_recovered, df_confirmed)
+end_stage("recovered_fill")
 
 # Data preprocessing for times series countries graph display
-# create temp to store sorting arrangement for all confirm, deaths and recovered.
-df_confirmed_sort_temp = df_confirmed.sort_values(
-    by=df_confirmed.columns[-1], ascending=False
+# Dates x locations frames built straight from the int32 count block, all sharing
+# one location order, one set of "Province|Country" column labels and a
+# DatetimeIndex parsed once from the header.
+location_order = india_first_order(
+    df_confirmed.iloc[:, -1], df_confirmed["Country/Region"]
 )
+location_keys = pd.Index(location_key(df_confirmed).to_numpy()[location_order])
 
-df_confirmed_t = df_move1st_sg(df_confirmed_sort_temp)
-df_confirmed_t["Province+Country"] = (
-    df_confirmed_t[["Province/State", "Country/Region"]]
-    .fillna("nann")
-    .agg("|".join, axis=1)
-)
-df_confirmed_t = df_confirmed_t.drop(
-    ["Province/State", "Country/Region", "Lat", "Long"], axis=1
-).T
-
-df_deaths_t = df_deaths.reindex(df_confirmed_sort_temp.index)
-df_deaths_t = df_move1st_sg(df_deaths_t)
-df_deaths_t["Province+Country"] = (
-    df_deaths_t[["Province/State", "Country/Region"]]
-    .fillna("nann")
-    .agg("|".join, axis=1)
-)
-df_deaths_t = df_deaths_t.drop(
-    ["Province/State", "Country/Region", "Lat", "Long"], axis=1
-).T
-# take note use reovered_fill df
-df_recovered_t = df_recovered_fill.reindex(df_confirmed_sort_temp.index)
-df_recovered_t = df_move1st_sg(df_recovered_t)
-df_recovered_t["Province+Country"] = (
-    df_recovered_t[["Province/State", "Country/Region"]]
-    .fillna("nann")
-    .agg("|".join, axis=1)
+
+def dates_by_location(df, dates):
+    counts = df.iloc[:, 4:].to_numpy()[location_order]
+    return pd.DataFrame(counts.T, index=dates, columns=location_keys)
+
+
+# Country rollup cube: every location is mapped to an integer country code, and each
+# metric's countries x dates array is one np.add.reduceat over the location rows
+# grouped by code. The leaderboards, the highest 10 graph and the country totals
+# in the table are all slices of these arrays.
+countries = (
+    df_confirmed["Country/Region"]
+    .cat.categories.union(df_deaths["Country/Region"].cat.categories)
+    .union(df_recovered["Country/Region"].cat.categories)
 )
-df_recovered_t = df_recovered_t.drop(
-    ["Province/State", "Country/Region", "Lat", "Long"], axis=1
-).T
-
-df_confirmed_t.columns = df_confirmed_t.iloc[-1]
-df_confirmed_t = df_confirmed_t.drop("Province+Country")
-
-df_deaths_t.columns = df_deaths_t.iloc[-1]
-df_deaths_t = df_deaths_t.drop("Province+Country")
-
-df_recovered_t.columns = df_recovered_t.iloc[-1]
-df_recovered_t = df_recovered_t.drop("Province+Country")
-
-df_confirmed_t.index = pd.to_datetime(df_confirmed_t.index)
-df_deaths_t.index = pd.to_datetime(df_confirmed_t.index)
-df_recovered_t.index = pd.to_datetime(df_confirmed_t.index)
-df_active_t = df_confirmed_t.subtract(df_deaths_t.add(df_recovered_t))
-df_active_t.clip(lower=0, inplace=True)
-# Highest 10 plot data preprocessing
-# getting highest 10 countries with confirmed case
-name = pd.Index(df_confirmed_t.columns.map(lambda x: " | ".join(map(str, x)) if isinstance(x, tuple) else str(x)))
-name = name.map(lambda x: x.split("|", 1)[-1] if "|" in x else x)  # Fixing the splitting error
-
-
-df_confirmed_t_namechange = df_confirmed_t.copy()
-name0 = [x[0] for x in name]
-name1 = [x[1] for x in name]
-df_confirmed_t_namechange.columns = name1
-df_confirmed_t_namechange = df_confirmed_t_namechange.groupby(
-    df_confirmed_t_namechange.columns, axis=1
-).sum()
-df_confirmed_t_namechange10 = df_confirmed_t_namechange.sort_values(
-    by=df_confirmed_t_namechange.index[-1], axis=1, ascending=False
-).iloc[:, :10]
-df_confirmed_t_stack = df_confirmed_t_namechange10.stack()
-df_confirmed_t_stack = df_confirmed_t_stack.reset_index(level=[0, 1])
-df_confirmed_t_stack.rename(
-    columns={"level_0": "Date", "level_1": "Countries", 0: "Confirmed"}, inplace=True
+
+
+def country_codes(df):
+    return countries.get_indexer(df["Country/Region"])
+
+
+def rollup(df, codes):
+    counts = np.nan_to_num(df.iloc[:, 4:].to_numpy())
+    by_code = np.argsort(codes, kind="stable")
+    sorted_codes = codes[by_code]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    cube = np.zeros((len(countries), counts.shape[1]), dtype=np.int64)
+    cube[sorted_codes[starts]] = np.add.reduceat(
+        counts[by_code], starts, axis=0, dtype=np.int64
+    )
+    return cube
+
+
+def rollups(df_confirmed, df_deaths, df_recovered):
+    confirmed = rollup(df_confirmed, country_codes(df_confirmed))
+    deaths = rollup(df_deaths, country_codes(df_deaths))
+    # recovered is rolled up from its own rows, some countries only report a national total
+    recovered = rollup(df_recovered, country_codes(df_recovered))
+    active = np.clip(confirmed - (deaths + recovered), 0, None)
+    return confirmed, deaths, recovered, active
+
+
+location_country = country_codes(df_confirmed)
+country_confirmed, country_deaths, country_recovered, country_active = rollups(
+    df_confirmed, df_deaths, df_recovered
 )
-# getting highest 10 countries with deceased case
-name = pd.Index(df_deaths_t.columns.map(lambda x: " | ".join(map(str, x)) if isinstance(x, tuple) else str(x))).str.split("|", n=1)
-
-df_deaths_t_namechange = df_deaths_t.copy()
-# name0 = [x[0] for x in name]
-name1 = [x[1] for x in name]
-df_deaths_t_namechange.columns = name1
-df_deaths_t_namechange = df_deaths_t_namechange.groupby(
-    df_deaths_t_namechange.columns, axis=1
-).sum()
-df_deaths_t_namechange10 = df_deaths_t_namechange.sort_values(
-    by=df_deaths_t_namechange.index[-1], axis=1, ascending=False
-).iloc[:, :10]
-df_deaths_t_stack = df_deaths_t_namechange10.stack()
-df_deaths_t_stack = df_deaths_t_stack.reset_index(level=[0, 1])
-df_deaths_t_stack.rename(
-    columns={"level_0": "Date", "level_1": "Countries", 0: "Deceased"}, inplace=True
+
+# Latest day and past 24hrs increase per country for the leaderboards
+country_latest = pd.DataFrame(
+    {
+        "Country/Region": countries,
+        "Confirmed": country_confirmed[:, -1],
+        "Confirmed_24hr": country_confirmed[:, -1] - country_confirmed[:, -2],
+        "Deaths": country_deaths[:, -1],
+        "Deaths_24hr": country_deaths[:, -1] - country_deaths[:, -2],
+    }
 )
 
+
+end_stage("rollup")
+
+
+# Highest 10 plot data preprocessing: long Date/Countries/value frame of the 10
+# countries with the highest latest count, in rank order
+def highest_10_stack(cube, dates, value_name):
+    top = np.argsort(-cube[:, -1], kind="stable")[:10]
+    return pd.DataFrame(
+        {
+            "Date": np.repeat(dates, len(top)),
+            "Countries": np.tile(countries[top], len(dates)),
+            value_name: cube[top].T.ravel(),
+        }
+    )
+
+
 # Recreate required columns for map data
-map_data = df_confirmed[["Province/State", "Country/Region", "Lat", "Long"]]
+map_data = df_confirmed[["Province/State", "Country/Region", "Lat", "Long"]].copy()
 map_data["Confirmed"] = df_confirmed.loc[:, df_confirmed.columns[-1]]
 map_data["Deaths"] = df_deaths.loc[:, df_deaths.columns[-1]]
 map_data["Recovered"] = df_recovered_fill.loc[:, df_recovered_fill.columns[-1]]
-map_data["Recovered"] = map_data["Recovered"].fillna(0).astype(int)
+map_data["Recovered"] = map_data["Recovered"].fillna(0).astype(np.int32)
 map_data["Active"] = map_data["Confirmed"] - (
     map_data["Deaths"] + map_data["Recovered"]
 )
-map_data["Active"].clip(lower=0, inplace=True)
+map_data["Active"] = map_data["Active"].clip(lower=0)
 
 # last 24 hours increase
 map_data["Deaths_24hr"] = df_deaths.iloc[:, -1] - df_deaths.iloc[:, -2]
+# rows without a recovered series (the counties among them) count 0, as above
 map_data["Recovered_24hr"] = (
-    df_recovered_fill.iloc[:, -1] - df_recovered_fill.iloc[:, -2]
+    (df_recovered_fill.iloc[:, -1] - df_recovered_fill.iloc[:, -2])
+    .fillna(0)
+    .astype(np.int32)
 )
 map_data["Confirmed_24hr"] = df_confirmed.iloc[:, -1] - df_confirmed.iloc[:, -2]
 
 map_data["Active_24hr"] = map_data["Confirmed_24hr"] - (
     map_data["Deaths_24hr"] + map_data["Recovered_24hr"]
 )
-map_data["Active_24hr"].clip(lower=0, inplace=True)
-map_data.sort_values(by="Confirmed", ascending=False, inplace=True)
+map_data["Active_24hr"] = map_data["Active_24hr"].clip(lower=0)
+# same row order as the columns of the *_t frames, the table selects by position
+map_data = map_data.iloc[location_order]
+end_stage("map_data")
+
+###########################################################################
+# Table rows for the flat and country/province drill-down modes.
+# Row ids are "l<position>" for a location (column of the *_t frames, row of
+# map_data) and "c<code>" for a country total (column of the country frames).
+###########################################################################
+table_columns = [
+    "Province/State",
+    "Country/Region",
+    "Confirmed",
+    "Active",
+    "Deaths",
+    "Recovered",
+]
+location_rows = (
+    map_data[table_columns]
+    .assign(id=["l" + str(i) for i in range(len(map_data))])
+    .to_dict("records")
+)
+
+# Country level frames share the layout of the *_t frames, so the single country
+# graphs draw a country total with the same builders
+country_labels = "nann|" + countries
+
+# Locations of each country as a contiguous run of positions, largest first
+ordered_country = location_country[location_order]
+by_country = np.argsort(ordered_country, kind="stable")
+country_starts = np.searchsorted(ordered_country[by_country], np.arange(len(countries)))
+country_stops = np.searchsorted(
+    ordered_country[by_country], np.arange(len(countries)), side="right"
+)
+# a country is centred on the map at its largest location
+country_coords = {
+    code: (
+        float(map_data["Lat"].iloc[by_country[country_starts[code]]]),
+        float(map_data["Long"].iloc[by_country[country_starts[code]]]),
+    )
+    for code in range(len(countries))
+    if country_stops[code] > country_starts[code]
+}
+
+country_rows = {}
+province_rows = {}
+for code in india_first_order(country_confirmed[:, -1], countries):
+    start, stop = country_starts[code], country_stops[code]
+    if stop == start:
+        continue
+    locations = [location_rows[i] for i in by_country[start:stop]]
+    expandable = len(locations) > 1 or pd.notna(locations[0]["Province/State"])
+    country_rows[code] = {
+        "id": "c" + str(code),
+        "expand": "+" if expandable else "",
+        "Province/State": None,
+        "Country/Region": countries[code],
+        "Confirmed": int(country_confirmed[code, -1]),
+        "Active": int(country_active[code, -1]),
+        "Deaths": int(country_deaths[code, -1]),
+        "Recovered": int(country_recovered[code, -1]),
+    }
+    if expandable:
+        province_rows[code] = [dict(row, expand="") for row in locations]
+
+
+def table_column_specs(drilldown=False):
+    return [
+        {
+            "name": "" if i == "expand" else i,
+            "id": i,
+            "deletable": False,
+            "selectable": True,
+        }
+        for i in (["expand"] if drilldown else []) + table_columns
+    ]
+
+
+def drilldown_rows(expanded):
+    rows = []
+    for code, row in country_rows.items():
+        if code in expanded:
+            rows.append(dict(row, expand="-"))
+            rows.extend(province_rows[code])
+        else:
+            rows.append(row)
+    return rows
 
-map_data["new"] = range(1, len(map_data) + 1)
-map_data.loc[map_data[map_data["Country/Region"] == "India"].index.values, "new"] = 0
-map_data = map_data.sort_values("new").drop("new", axis=1)
+
+end_stage("table_rows")
+
+
+#############################################################################
+# Full history for the time series graphs, parsed from the downloaded bytes on
+# a background thread while the latest-day views are already served. Callbacks
+# drawing it call wait_for_history() first; until then the names below hold
+# None (and the totals only the latest days).
+#############################################################################
+history_loaded = threading.Event()
+history_error = None
+dates = None
+df_confirmed_t = df_deaths_t = df_recovered_t = df_active_t = None
+df_confirmed_t_stack = df_deaths_t_stack = None
+df_country_confirmed_t = df_country_deaths_t = None
+df_country_recovered_t = df_country_active_t = None
+
+
+def load_history():
+    global history_error, raw_csvs, dates
+    global df_confirmed_total, df_deaths_total, df_recovered_total
+    global df_confirmed_t, df_deaths_t, df_recovered_t, df_active_t
+    global df_confirmed_t_stack, df_deaths_t_stack
+    global df_country_confirmed_t, df_country_deaths_t
+    global df_country_recovered_t, df_country_active_t
+    started = [time.perf_counter()]
+    try:
+        confirmed, deaths, recovered = combine(
+            [read(io.BytesIO(raw)) for read, raw in zip(readers, raw_csvs)]
+        )
+        # the bytes are not needed any more
+        raw_csvs = None
+        end_stage("history_read_csv", started)
+
+        df_confirmed_total = daily_totals(confirmed)
+        df_deaths_total = daily_totals(deaths)
+        df_recovered_total = daily_totals(recovered)
+        dates = df_confirmed_total.index
+        recovered_filled = recovered_fill(recovered, confirmed)
+        end_stage("history_totals", started)
+
+        df_confirmed_t = dates_by_location(confirmed, dates)
+        df_deaths_t = dates_by_location(deaths, dates)
+        # take note use reovered_fill df
+        df_recovered_t = dates_by_location(recovered_filled, dates)
+        active_t = df_confirmed_t.subtract(df_deaths_t.add(df_recovered_t))
+        df_active_t = active_t.clip(lower=0)
+        end_stage("history_time_series", started)
+
+        cubes = rollups(confirmed, deaths, recovered)
+        df_confirmed_t_stack = highest_10_stack(cubes[0], dates, "Confirmed")
+        df_deaths_t_stack = highest_10_stack(cubes[1], dates, "Deceased")
+        (
+            df_country_confirmed_t,
+            df_country_deaths_t,
+            df_country_recovered_t,
+            df_country_active_t,
+        ) = (
+            pd.DataFrame(cube.T, index=dates, columns=country_labels) for cube in cubes
+        )
+        end_stage("history_rollup", started)
+    except BaseException as exc:
+        history_error = exc
+        raise
+    finally:
+        history_loaded.set()
+
+
+def wait_for_history(timeout=None):
+    if not history_loaded.wait(timeout):
+        raise TimeoutError("history is still loading")
+    if history_error is not None:
+        raise RuntimeError("loading the history failed") from history_error
+
+
+# Not a daemon: a process exiting while pyarrow still parses on a daemon thread
+# can hang at interpreter shutdown, so exit waits for the history instead
+threading.Thread(target=load_history, name="load-history").start()
 
 
 #############################################################################
 # mapbox_access_token keys, not all mapbox function require token to function.
 #############################################################################
-mapbox_access_token = ""  # enter mapbox access token here
+# enter mapbox access token here, or set MAPBOX_ACCESS_TOKEN
+mapbox_access_token = os.environ.get("MAPBOX_ACCESS_TOKEN", "")
+
+# Background-only Mapbox GL style: no token, tiles or glyphs to fetch. Used
+# when self-hosting, and without a token, which the mapbox:// styles require
+offline_map_style = {
+    "version": 8,
+    "sources": {},
+    "layers": [
+        {
+            "id": "background",
+            "type": "background",
+            "paint": {"background-color": colors["highest_case_bg"]},
+        }
+    ],
+}
+map_style = "mapbox://styles/mapbox/dark-v10"
+if self_hosted_assets or not mapbox_access_token:
+    map_style = offline_map_style
+if os.environ.get("MAP_STYLE"):
+    # any Plotly mapbox style, e.g. open-street-map, carto-darkmatter, white-bg
+    map_style = os.environ["MAP_STYLE"]
 
 ###########################
 # functions to create map
 ###########################
 
 
+# Marker size column and colour of each display type ("active" is sized by deaths)
+map_markers = {
+    "confirmed": ("Confirmed", None),
+    "active": ("Deaths", "#f1f772"),
+    "deaths": ("Deaths", "red"),
+    "recovered": ("Recovered", "#81FF33"),
+}
+map_hover_columns = [
+    ("Country/Region: ", "Country/Region"),
+    (" <br>Province/State: ", "Province/State"),
+    (" <br>Active: ", "Active"),
+    (" (+ ", "Active_24hr"),
+    (" past 24hrs)<br>Confirmed: ", "Confirmed"),
+    (" (+ ", "Confirmed_24hr"),
+    (" past 24hrs)<br>Deaths: ", "Deaths"),
+    (" (+ ", "Deaths_24hr"),
+    (" past 24hrs)<br>Recovered: ", "Recovered"),
+    (" (+ ", "Recovered_24hr"),
+]
+
+
+# One hover text per location, concatenated column by column rather than
+# formatted row by row; each text is wrapped in its own list as before
+def map_hovertext(map_data):
+    text = ""
+    for label, column in map_hover_columns:
+        text = text + label + map_data[column].astype(str).to_numpy(dtype=object)
+    text = text + " past 24hrs)"
+    return text.reshape(-1, 1).tolist()
+
+
 def gen_map(map_data, zoom, lat, lon, map_disp_type="confirmed"):
-    if map_disp_type == "confirmed":
-        return {
-            "data": [
-                {
-                    "type": "scattermapbox",  # specify the type of data to generate, in this case, scatter map box is used
-                    "lat": list(map_data["Lat"]),  # for markers location
-                    "lon": list(map_data["Long"]),
-                    # "hoverinfo": "text",
-                    "hovertext": [
-                        [
-                            "Country/Region: {} <br>Province/State: {} <br>Active: {} (+ {} past 24hrs)<br>Confirmed: {} (+ {} past 24hrs)<br>Deaths: {} (+ {} past 24hrs)<br>Recovered: {} (+ {} past 24hrs)".format(
-                                i, j, k, k24, l, l24, m, m24, n, n24
-                            )
-                        ]
-                        for i, j, k, l, m, n, k24, l24, m24, n24 in zip(
-                            map_data["Country/Region"],
-                            map_data["Province/State"],
-                            map_data["Active"],
-                            map_data["Confirmed"],
-                            map_data["Deaths"],
-                            map_data["Recovered"],
-                            map_data["Active_24hr"],
-                            map_data["Confirmed_24hr"],
-                            map_data["Deaths_24hr"],
-                            map_data["Recovered_24hr"],
-                        )
-                    ],
-                    "mode": "markers",
-                    "name": list(map_data["Country/Region"]),
-                    "marker": {
-                        "opacity": 0.5,
-                        "size": np.log(map_data["Confirmed"]),
-                    },
-                },
-            ],
-            "layout": dict(
-                autosize=True,
-                height=350,
-                font=dict(color=colors["figure_text"]),
-                titlefont=dict(color=colors["text"], size="14"),
-                margin=dict(l=0, r=0, b=0, t=0),
-                hovermode="closest",
-                plot_bgcolor=colors["background"],
-                paper_bgcolor=colors["background"],
-                legend=dict(font=dict(size=10), orientation="h"),
-                mapbox=dict(
-                    accesstoken=mapbox_access_token,
-                    style="mapbox://styles/mapbox/dark-v10",
-                    center=dict(
-                        lon=lon,
-                        lat=lat,
-                    ),
-                    zoom=zoom,
-                ),
-            ),
-        }
-    elif map_disp_type == "active":
-        return {
-            "data": [
-                {
-                    "type": "scattermapbox",  # specify the type of data to generate, in this case, scatter map box is used
-                    "lat": list(map_data["Lat"]),  # for markers location
-                    "lon": list(map_data["Long"]),
-                    # "hoverinfo": "text",
-                    "hovertext": [
-                        [
-                            "Country/Region: {} <br>Province/State: {} <br>Active: {} (+ {} past 24hrs)<br>Confirmed: {} (+ {} past 24hrs)<br>Deaths: {} (+ {} past 24hrs)<br>Recovered: {} (+ {} past 24hrs)".format(
-                                i, j, k, k24, l, l24, m, m24, n, n24
-                            )
-                        ]
-                        for i, j, k, l, m, n, k24, l24, m24, n24 in zip(
-                            map_data["Country/Region"],
-                            map_data["Province/State"],
-                            map_data["Active"],
-                            map_data["Confirmed"],
-                            map_data["Deaths"],
-                            map_data["Recovered"],
-                            map_data["Active_24hr"],
-                            map_data["Confirmed_24hr"],
-                            map_data["Deaths_24hr"],
-                            map_data["Recovered_24hr"],
-                        )
-                    ],
-                    "mode": "markers",
-                    "name": list(map_data["Country/Region"]),
-                    "marker": {
-                        "opacity": 0.5,
-                        "size": np.log(map_data["Deaths"]),
-                        "color": "#f1f772",
-                    },
-                },
-            ],
-            "layout": dict(
-                autosize=True,
-                height=350,
-                font=dict(color=colors["figure_text"]),
-                titlefont=dict(color=colors["text"], size="14"),
-                margin=dict(l=0, r=0, b=0, t=0),
-                hovermode="closest",
-                plot_bgcolor=colors["background"],
-                paper_bgcolor=colors["background"],
-                legend=dict(font=dict(size=10), orientation="h"),
-                mapbox=dict(
-                    accesstoken=mapbox_access_token,
-                    style="mapbox://styles/mapbox/dark-v10",
-                    center=dict(
-                        lon=lon,
-                        lat=lat,
-                    ),
-                    zoom=zoom,
-                ),
-            ),
-        }
-    elif map_disp_type == "deaths":
-        return {
-            "data": [
-                {
-                    "type": "scattermapbox",  # specify the type of data to generate, in this case, scatter map box is used
-                    "lat": list(map_data["Lat"]),  # for markers location
-                    "lon": list(map_data["Long"]),
-                    # "hoverinfo": "text",
-                    "hovertext": [
-                        [
-                            "Country/Region: {} <br>Province/State: {} <br>Active: {} (+ {} past 24hrs)<br>Confirmed: {} (+ {} past 24hrs)<br>Deaths: {} (+ {} past 24hrs)<br>Recovered: {} (+ {} past 24hrs)".format(
-                                i, j, k, k24, l, l24, m, m24, n, n24
-                            )
-                        ]
-                        for i, j, k, l, m, n, k24, l24, m24, n24 in zip(
-                            map_data["Country/Region"],
-                            map_data["Province/State"],
-                            map_data["Active"],
-                            map_data["Confirmed"],
-                            map_data["Deaths"],
-                            map_data["Recovered"],
-                            map_data["Active_24hr"],
-                            map_data["Confirmed_24hr"],
-                            map_data["Deaths_24hr"],
-                            map_data["Recovered_24hr"],
-                        )
-                    ],
-                    "mode": "markers",
-                    "name": list(map_data["Country/Region"]),
-                    "marker": {
-                        "opacity": 0.5,
-                        "size": np.log(map_data["Deaths"]),
-                        "color": "red",
-                    },
-                },
-            ],
-            "layout": dict(
-                autosize=True,
-                height=350,
-                font=dict(color=colors["figure_text"]),
-                titlefont=dict(color=colors["text"], size="14"),
-                margin=dict(l=0, r=0, b=0, t=0),
-                hovermode="closest",
-                plot_bgcolor=colors["background"],
-                paper_bgcolor=colors["background"],
-                legend=dict(font=dict(size=10), orientation="h"),
-                mapbox=dict(
-                    accesstoken=mapbox_access_token,
-                    style="mapbox://styles/mapbox/dark-v10",
-                    center=dict(
-                        lon=lon,
-                        lat=lat,
-                    ),
-                    zoom=zoom,
-                ),
-            ),
-        }
-    else:
-        return {
-            "data": [
-                {
-                    "type": "scattermapbox",  # specify the type of data to generate, in this case, scatter map box is used
-                    "lat": list(map_data["Lat"]),  # for markers location
-                    "lon": list(map_data["Long"]),
-                    # "hoverinfo": "text",
-                    "hovertext": [
-                        [
-                            "Country/Region: {} <br>Province/State: {} <br>Active: {} (+ {} past 24hrs)<br>Confirmed: {} (+ {} past 24hrs)<br>Deaths: {} (+ {} past 24hrs)<br>Recovered: {} (+ {} past 24hrs)".format(
-                                i, j, k, k24, l, l24, m, m24, n, n24
-                            )
-                        ]
-                        for i, j, k, l, m, n, k24, l24, m24, n24 in zip(
-                            map_data["Country/Region"],
-                            map_data["Province/State"],
-                            map_data["Active"],
-                            map_data["Confirmed"],
-                            map_data["Deaths"],
-                            map_data["Recovered"],
-                            map_data["Active_24hr"],
-                            map_data["Confirmed_24hr"],
-                            map_data["Deaths_24hr"],
-                            map_data["Recovered_24hr"],
-                        )
-                    ],
-                    "mode": "markers",
-                    "name": list(map_data["Country/Region"]),
-                    "marker": {
-                        "opacity": 0.5,
-                        "size": np.log(map_data["Recovered"]),
-                        "color": "#81FF33",
-                    },
-                },
-            ],
-            "layout": dict(
-                autosize=True,
-                height=350,
-                font=dict(color=colors["figure_text"]),
-                titlefont=dict(color=colors["text"], size="14"),
-                margin=dict(l=0, r=0, b=0, t=0),
-                hovermode="closest",
-                plot_bgcolor=colors["background"],
-                paper_bgcolor=colors["background"],
-                legend=dict(font=dict(size=10), orientation="h"),
-                mapbox=dict(
-                    accesstoken=mapbox_access_token,
-                    style="mapbox://styles/mapbox/dark-v10",
-                    center=dict(
-                        lon=lon,
-                        lat=lat,
-                    ),
-                    zoom=zoom,
+    size_column, color = map_markers.get(map_disp_type, map_markers["recovered"])
+    marker = {"opacity": 0.5}
+    # locations without cases get a -inf size, which plotly leaves out
+    with np.errstate(divide="ignore"):
+        marker["size"] = np.log(map_data[size_column])
+    if color is not None:
+        marker["color"] = color
+    return {
+        "data": [
+            {
+                "type": "scattermapbox",  # specify the type of data to generate, in this case, scatter map box is used
+                "lat": map_data["Lat"].astype(float).round(5).tolist(),
+                "lon": map_data["Long"].astype(float).round(5).tolist(),
+                # "hoverinfo": "text",
+                "hovertext": map_hovertext(map_data),
+                "mode": "markers",
+                "name": map_data["Country/Region"].astype(str).tolist(),
+                "marker": marker,
+            },
+        ],
+        "layout": dict(
+            autosize=True,
+            height=350,
+            font=dict(color=colors["figure_text"]),
+            titlefont=dict(color=colors["text"], size="14"),
+            margin=dict(l=0, r=0, b=0, t=0),
+            hovermode="closest",
+            plot_bgcolor=colors["background"],
+            paper_bgcolor=colors["background"],
+            legend=dict(font=dict(size=10), orientation="h"),
+            mapbox=dict(
+                accesstoken=mapbox_access_token,
+                style=map_style,
+                center=dict(
+                    lon=lon,
+                    lat=lat,
                 ),
+                zoom=zoom,
             ),
-        }
+        ),
+    }
 
 
 ##############################################
@@ -614,77 +749,57 @@ def return_outbreakdays(date_str):
 
 noToDisplay = 8
 
-confirm_cases = []
-for i in range(noToDisplay):
-    confirm_cases.append(
-        high_cases(
-            df_confirmed_sorted_total.iloc[i, 0],
-            df_confirmed_sorted_total.iloc[i, 1],
-            df_confirmed_sorted_total.iloc[i, 2],
-        )
-    )
 
-deaths_cases = []
-for i in range(noToDisplay):
-    deaths_cases.append(
-        high_cases(
-            df_deaths_confirmed_sorted_total.iloc[i, 0],
-            df_deaths_confirmed_sorted_total.iloc[i, 1],
-            df_deaths_confirmed_sorted_total.iloc[i, 3],
-            "#ff3b4a",
-            df_deaths_confirmed_sorted_total.iloc[i, 2],
-            True,
-        )
+def leaderboard(by):
+    return country_latest.sort_values(by=by, ascending=False, kind="stable").head(
+        noToDisplay
     )
 
-confirm_cases_24hrs = []
-for i in range(noToDisplay):
-    confirm_cases_24hrs.append(
-        high_cases(
-            df_confirmed_sorted_total.sort_values(
-                by=df_confirmed_sorted_total.columns[-1], ascending=False
-            ).iloc[i, 0],
-            df_confirmed_sorted_total.sort_values(
-                by=df_confirmed_sorted_total.columns[-1], ascending=False
-            ).iloc[i, 1],
-            df_confirmed_sorted_total.sort_values(
-                by=df_confirmed_sorted_total.columns[-1], ascending=False
-            ).iloc[i, 2],
-        )
+
+confirm_cases = [
+    high_cases(row["Country/Region"], row["Confirmed"], row["Confirmed_24hr"])
+    for _, row in leaderboard("Confirmed").iterrows()
+]
+
+deaths_cases = [
+    high_cases(
+        row["Country/Region"],
+        row["Deaths"],
+        row["Deaths_24hr"],
+        "#ff3b4a",
+        row["Confirmed"],
+        True,
     )
+    for _, row in leaderboard("Deaths").iterrows()
+]
 
-deaths_cases_24hrs = []
-for i in range(noToDisplay):
-    deaths_cases_24hrs.append(
-        high_cases(
-            df_deaths_confirmed_sorted_total.sort_values(
-                by=df_deaths_confirmed_sorted_total.columns[-1], ascending=False
-            ).iloc[i, 0],
-            df_deaths_confirmed_sorted_total.sort_values(
-                by=df_deaths_confirmed_sorted_total.columns[-1], ascending=False
-            ).iloc[i, 1],
-            df_deaths_confirmed_sorted_total.sort_values(
-                by=df_deaths_confirmed_sorted_total.columns[-1], ascending=False
-            ).iloc[i, 3],
-            "#ff3b4a",
-            df_deaths_confirmed_sorted_total.sort_values(
-                by=df_deaths_confirmed_sorted_total.columns[-1], ascending=False
-            ).iloc[i, 2],
-            True,
-        )
+confirm_cases_24hrs = [
+    high_cases(row["Country/Region"], row["Confirmed"], row["Confirmed_24hr"])
+    for _, row in leaderboard("Confirmed_24hr").iterrows()
+]
+
+deaths_cases_24hrs = [
+    high_cases(
+        row["Country/Region"],
+        row["Deaths"],
+        row["Deaths_24hr"],
+        "#ff3b4a",
+        row["Confirmed"],
+        True,
     )
+    for _, row in leaderboard("Deaths_24hr").iterrows()
+]
+end_stage("leaderboards")
 
 
 ####################################################
 # Prepare plotly figure to attached to dcc component
 # Global outbreak Plot
 ####################################################
-# Change date index to datetimeindex and share x-axis with all the plot
+# The totals have a datetimeindex, and share x-axis with all the plot
 def draw_global_graph(
     df_confirmed_total, df_deaths_total, df_recovered_total, graph_type="Total Cases"
 ):
-    df_confirmed_total.index = pd.to_datetime(df_confirmed_total.index)
-
     if graph_type == "Daily Cases":
         df_confirmed_total = (df_confirmed_total - df_confirmed_total.shift(1)).drop(
             df_confirmed_total.index[0]
@@ -762,6 +877,9 @@ def draw_global_graph(
 def draw_highest_10(
     df_confirmed_t_stack, df_deaths_t_stack, graphHigh10_type="Confirmed Cases"
 ):
+    # plotly.express is only needed here, import it on the first call rather
+    # than on every worker boot (gunicorn.conf.py preloads it in the master)
+    import plotly.express as px
 
     if graphHigh10_type == "Confirmed Cases":
         fig = px.line(
@@ -819,22 +937,23 @@ def draw_singleCountry_Scatter(
     selected_row=0,
     daily_change=False,
 ):
+    # Select the one column first: the builders run concurrently on shared
+    # frames, so they only ever derive new (small) series from them
+    confirmed = df_confirmed_t.iloc[:, selected_row]
+    deaths = df_deaths_t.iloc[:, selected_row]
+    recovered = df_recovered_t.iloc[:, selected_row]
+    active = df_active_t.iloc[:, selected_row]
 
     if daily_change:
-        df_confirmed_t = (df_confirmed_t - df_confirmed_t.shift(1)).drop(
-            df_confirmed_t.index[0]
-        )
-        df_deaths_t = (df_deaths_t - df_deaths_t.shift(1)).drop(df_deaths_t.index[0])
-        df_recovered_t = (df_recovered_t - df_recovered_t.shift(1)).drop(
-            df_recovered_t.index[0]
-        )
-        df_active_t = (df_active_t - df_active_t.shift(1)).drop(df_active_t.index[0])
-        df_active_t.clip(lower=0, inplace=True)
+        confirmed = confirmed.diff().iloc[1:]
+        deaths = deaths.diff().iloc[1:]
+        recovered = recovered.diff().iloc[1:]
+        active = active.diff().iloc[1:].clip(lower=0)
     fig = go.Figure()
     fig.add_trace(
         go.Scatter(
-            x=df_confirmed_t.index,
-            y=df_confirmed_t.iloc[:, selected_row],
+            x=confirmed.index,
+            y=confirmed,
             mode="lines+markers",
             name="Confirmed",
             line=dict(color="#3372FF", width=2),
@@ -843,8 +962,8 @@ def draw_singleCountry_Scatter(
     )
     fig.add_trace(
         go.Scatter(
-            x=df_active_t.index,
-            y=df_active_t.iloc[:, selected_row],
+            x=active.index,
+            y=active,
             mode="lines+markers",
             name="Active",
             line=dict(color="#f1f772", width=2),
@@ -853,8 +972,8 @@ def draw_singleCountry_Scatter(
     )
     fig.add_trace(
         go.Scatter(
-            x=df_recovered_t.index,
-            y=df_recovered_t.iloc[:, selected_row],
+            x=recovered.index,
+            y=recovered,
             mode="lines+markers",
             name="Recovered",
             line=dict(color="#33FF51", width=2),
@@ -863,8 +982,8 @@ def draw_singleCountry_Scatter(
     )
     fig.add_trace(
         go.Scatter(
-            x=df_deaths_t.index,
-            y=df_deaths_t.iloc[:, selected_row],
+            x=deaths.index,
+            y=deaths,
             mode="lines+markers",
             name="Deceased",
             line=dict(color="#FF3333", width=2),
@@ -918,46 +1037,41 @@ def draw_singleCountry_Bar(
     selected_row=0,
     graph_line="Bar Chart",
 ):
-
-    df_confirmed_t = (df_confirmed_t - df_confirmed_t.shift(1)).drop(
-        df_confirmed_t.index[0]
-    )
-    df_deaths_t = (df_deaths_t - df_deaths_t.shift(1)).drop(df_deaths_t.index[0])
-    df_recovered_t = (df_recovered_t - df_recovered_t.shift(1)).drop(
-        df_recovered_t.index[0]
-    )
-    df_active_t = (df_active_t - df_active_t.shift(1)).drop(df_active_t.index[0])
-    df_active_t.clip(lower=0, inplace=True)
+    # Daily changes of the selected column only (not the whole frame)
+    confirmed = df_confirmed_t.iloc[:, selected_row].diff().iloc[1:]
+    deaths = df_deaths_t.iloc[:, selected_row].diff().iloc[1:]
+    recovered = df_recovered_t.iloc[:, selected_row].diff().iloc[1:]
+    active = df_active_t.iloc[:, selected_row].diff().iloc[1:].clip(lower=0)
     fig = go.Figure()
     if graph_line == "Bar Chart":
         fig.add_trace(
             go.Bar(
-                x=df_confirmed_t.index,
-                y=df_confirmed_t.iloc[:, selected_row],
+                x=confirmed.index,
+                y=confirmed,
                 name="Confirmed",
                 marker_color="#3372FF",
             )
         )
         fig.add_trace(
             go.Bar(
-                x=df_active_t.index,
-                y=df_active_t.iloc[:, selected_row],
+                x=active.index,
+                y=active,
                 name="Active",
                 marker_color="#f1f772",
             )
         )
         fig.add_trace(
             go.Bar(
-                x=df_recovered_t.index,
-                y=df_recovered_t.iloc[:, selected_row],
+                x=recovered.index,
+                y=recovered,
                 name="Recovered",
                 marker_color="#33FF51",
             )
         )
         fig.add_trace(
             go.Bar(
-                x=df_deaths_t.index,
-                y=df_deaths_t.iloc[:, selected_row],
+                x=deaths.index,
+                y=deaths,
                 name="Deceased",
                 marker_color="#FF3333",
             )
@@ -966,8 +1080,8 @@ def draw_singleCountry_Bar(
     else:
         fig.add_trace(
             go.Scatter(
-                x=df_confirmed_t.index,
-                y=df_confirmed_t.iloc[:, selected_row],
+                x=confirmed.index,
+                y=confirmed,
                 mode="lines+markers",
                 name="Confirmed",
                 line=dict(color="#3372FF", width=2),
@@ -976,8 +1090,8 @@ def draw_singleCountry_Bar(
         )
         fig.add_trace(
             go.Scatter(
-                x=df_active_t.index,
-                y=df_active_t.iloc[:, selected_row],
+                x=active.index,
+                y=active,
                 mode="lines+markers",
                 name="Active",
                 line=dict(color="#f1f772", width=2),
@@ -986,8 +1100,8 @@ def draw_singleCountry_Bar(
         )
         fig.add_trace(
             go.Scatter(
-                x=df_recovered_t.index,
-                y=df_recovered_t.iloc[:, selected_row],
+                x=recovered.index,
+                y=recovered,
                 mode="lines+markers",
                 name="Recovered",
                 line=dict(color="#33FF51", width=2),
@@ -996,8 +1110,8 @@ def draw_singleCountry_Bar(
         )
         fig.add_trace(
             go.Scatter(
-                x=df_deaths_t.index,
-                y=df_deaths_t.iloc[:, selected_row],
+                x=deaths.index,
+                y=deaths,
                 mode="lines+markers",
                 name="Deceased",
                 line=dict(color="#FF3333", width=2),
@@ -1113,7 +1227,7 @@ app.layout = html.Div(
                                 },
                             ),
                             html.P(
-                                f"{df_confirmed_total[-1]:,d}",
+                                f"{df_confirmed_total.iloc[-1]:,d}",
                                 style={
                                     "textAlign": "center",
                                     "color": colors["confirmed_text"],
@@ -1122,16 +1236,16 @@ app.layout = html.Div(
                             ),
                             html.P(
                                 "Past 24hrs increase: +"
-                                + f"{df_confirmed_total[-1] - df_confirmed_total[-2]:,d}"
+                                + f"{df_confirmed_total.iloc[-1] - df_confirmed_total.iloc[-2]:,d}"
                                 + " ("
                                 + str(
                                     round(
                                         (
                                             (
-                                                df_confirmed_total[-1]
-                                                - df_confirmed_total[-2]
+                                                df_confirmed_total.iloc[-1]
+                                                - df_confirmed_total.iloc[-2]
                                             )
-                                            / df_confirmed_total[-1]
+                                            / df_confirmed_total.iloc[-1]
                                         )
                                         * 100,
                                         2,
@@ -1157,7 +1271,7 @@ app.layout = html.Div(
                                 },
                             ),
                             html.P(
-                                f"{df_confirmed_total[-1]-(df_deaths_total[-1] + df_recovered_total[-1]):,d}",
+                                f"{df_confirmed_total.iloc[-1]-(df_deaths_total.iloc[-1] + df_recovered_total.iloc[-1]):,d}",
                                 style={
                                     "textAlign": "center",
                                     "color": colors["active_text"],
@@ -1166,32 +1280,32 @@ app.layout = html.Div(
                             ),
                             html.P(
                                 "Past 24hrs increase:"
-                                + f"{(df_confirmed_total[-1]-(df_deaths_total[-1] + df_recovered_total[-1])) - (df_confirmed_total[-2]-(df_deaths_total[-2] + df_recovered_total[-2])):,d}"
+                                + f"{(df_confirmed_total.iloc[-1]-(df_deaths_total.iloc[-1] + df_recovered_total.iloc[-1])) - (df_confirmed_total.iloc[-2]-(df_deaths_total.iloc[-2] + df_recovered_total.iloc[-2])):,d}"
                                 + " ("
                                 + str(
                                     round(
                                         (
                                             (
                                                 (
-                                                    df_confirmed_total[-1]
+                                                    df_confirmed_total.iloc[-1]
                                                     - (
-                                                        df_deaths_total[-1]
-                                                        + df_recovered_total[-1]
+                                                        df_deaths_total.iloc[-1]
+                                                        + df_recovered_total.iloc[-1]
                                                     )
                                                 )
                                                 - (
-                                                    df_confirmed_total[-2]
+                                                    df_confirmed_total.iloc[-2]
                                                     - (
-                                                        df_deaths_total[-2]
-                                                        + df_recovered_total[-2]
+                                                        df_deaths_total.iloc[-2]
+                                                        + df_recovered_total.iloc[-2]
                                                     )
                                                 )
                                             )
                                             / (
-                                                df_confirmed_total[-1]
+                                                df_confirmed_total.iloc[-1]
                                                 - (
-                                                    df_deaths_total[-1]
-                                                    + df_recovered_total[-1]
+                                                    df_deaths_total.iloc[-1]
+                                                    + df_recovered_total.iloc[-1]
                                                 )
                                             )
                                         )
@@ -1219,7 +1333,7 @@ app.layout = html.Div(
                                 },
                             ),
                             html.P(
-                                f"{df_deaths_total[-1]:,d}",
+                                f"{df_deaths_total.iloc[-1]:,d}",
                                 style={
                                     "textAlign": "center",
                                     "color": colors["deaths_text"],
@@ -1230,8 +1344,8 @@ app.layout = html.Div(
                                 "Mortality Rate: "
                                 + str(
                                     round(
-                                        df_deaths_total[-1]
-                                        / df_confirmed_total[-1]
+                                        df_deaths_total.iloc[-1]
+                                        / df_confirmed_total.iloc[-1]
                                         * 100,
                                         3,
                                     )
@@ -1256,7 +1370,7 @@ app.layout = html.Div(
                                 },
                             ),
                             html.P(
-                                f"{df_recovered_total[-1]:,d}",
+                                f"{df_recovered_total.iloc[-1]:,d}",
                                 style={
                                     "textAlign": "center",
                                     "color": colors["recovered_text"],
@@ -1267,8 +1381,8 @@ app.layout = html.Div(
                                 "Recovery Rate: "
                                 + str(
                                     round(
-                                        df_recovered_total[-1]
-                                        / df_confirmed_total[-1]
+                                        df_recovered_total.iloc[-1]
+                                        / df_confirmed_total.iloc[-1]
                                         * 100,
                                         3,
                                     )
@@ -1510,23 +1624,8 @@ app.layout = html.Div(
                     html.Div(
                         [
                             dt.DataTable(
-                                data=map_data.to_dict("records"),
-                                columns=[
-                                    {
-                                        "name": i,
-                                        "id": i,
-                                        "deletable": False,
-                                        "selectable": True,
-                                    }
-                                    for i in [
-                                        "Province/State",
-                                        "Country/Region",
-                                        "Confirmed",
-                                        "Active",
-                                        "Deaths",
-                                        "Recovered",
-                                    ]
-                                ],
+                                data=location_rows,
+                                columns=table_column_specs(),
                                 fixed_rows={"headers": True, "data": 0},
                                 style_header={
                                     "backgroundColor": "rgb(30, 30, 30)",
@@ -1573,6 +1672,7 @@ app.layout = html.Div(
                                     },
                                 ],
                                 style_cell_conditional=[
+                                    {"if": {"column_id": "expand"}, "width": "5%"},
                                     {
                                         "if": {"column_id": "Province/State"},
                                         "width": "20%",
@@ -1632,6 +1732,26 @@ app.layout = html.Div(
                         ],
                         className="six columns",
                     ),
+                    html.Div(
+                        [
+                            dcc.RadioItems(
+                                id="table-mode",
+                                options=[
+                                    {"label": i, "value": i}
+                                    for i in ["All locations", "Country drill-down"]
+                                ],
+                                value="All locations",
+                                labelStyle={"display": "inline-block"},
+                                style={
+                                    "fontSize": 20,
+                                    "textAlign": "center",
+                                },
+                            ),
+                            dcc.Store(id="expanded-countries", data=[]),
+                            dcc.Store(id="expand-click"),
+                        ],
+                        className="six columns",
+                    ),
                 ],
                 className="row",
             ),
@@ -1677,8 +1797,13 @@ app.layout = html.Div(
 )
 
 
+end_stage("layout")
+
+
 @app.callback(Output("global-graph", "figure"), [Input("graph-type", "value")])
+@metrics.timed_callback
 def update_graph(graph_type):
+    wait_for_history()
     fig_global = draw_global_graph(
         df_confirmed_total, df_deaths_total, df_recovered_total, graph_type
     )
@@ -1686,63 +1811,280 @@ def update_graph(graph_type):
 
 
 @app.callback(Output("high10-graph", "figure"), [Input("graph-high10-type", "value")])
+@metrics.timed_callback
 def update_graph_high10(graph_high10_type):
+    wait_for_history()
     fig_high10 = draw_highest_10(
         df_confirmed_t_stack, df_deaths_t_stack, graph_high10_type
     )
     return fig_high10
 
 
+# Only clicks on a +/- cell go to the server: any other cell keeps its focus,
+# keyboard navigation and copy without a round trip
+app.clientside_callback(
+    """
+    function(cell) {
+        if (cell && cell.column_id === "expand") {
+            return String(cell.row_id);
+        }
+        return window.dash_clientside.no_update;
+    }
+    """,
+    Output("expand-click", "data"),
+    Input("datatable", "active_cell"),
+    prevent_initial_call=True,
+)
+
+
+@app.callback(
+    [
+        Output("datatable", "data"),
+        Output("datatable", "columns"),
+        Output("datatable", "selected_rows"),
+        Output("datatable", "active_cell"),
+        Output("expanded-countries", "data"),
+        Output("expand-click", "data"),
+    ],
+    [
+        Input("table-mode", "value"),
+        Input("expand-click", "data"),
+    ],
+    [
+        State("expanded-countries", "data"),
+        State("datatable", "selected_row_ids"),
+    ],
+    prevent_initial_call=True,
+)
+@metrics.timed_callback
+def update_table(table_mode, expand_click, expanded, selected_row_ids):
+    if table_mode != "Country drill-down":
+        rows, columns, expanded = location_rows, table_column_specs(), []
+    else:
+        # clicking the +/- cell of a country row expands or collapses its provinces
+        expanded = set(expanded or [])
+        row_id = expand_click or ""
+        code = int(row_id[1:]) if row_id.startswith("c") else None
+        if code in province_rows:
+            expanded ^= {code}
+        rows, columns, expanded = (
+            drilldown_rows(expanded),
+            table_column_specs(True),
+            sorted(expanded),
+        )
+    # keep the same row selected although its position may have moved
+    selected = [
+        i for i, row in enumerate(rows) if row["id"] in (selected_row_ids or [])
+    ]
+    # The click is cleared once handled, so a mode change arrives without one
+    # and clicking the same +/- cell again toggles it back; the response
+    # depends only on the inputs, as the cache key assumes.
+    return rows, columns, selected, None, expanded, None
+
+
+# The map needs only the latest day, so it is not held up by the history
+@app.callback(
+    Output("map-graph", "figure"),
+    [
+        Input("datatable", "selected_row_ids"),
+        Input("map-disp-type", "value"),
+    ],
+)
+@metrics.timed_callback
+def update_map(selected_row_ids, map_disp_type):
+    if not selected_row_ids:
+        zoom, lat, lon = 1, 1.2833, 103.8333
+    else:
+        # "c<code>" rows are country totals, centred on their largest location
+        row_id = selected_row_ids[0]
+        column = int(row_id[1:])
+        if row_id.startswith("c"):
+            lat, lon = country_coords[column]
+        else:
+            lat = float(map_data["Lat"].iloc[column])
+            lon = float(map_data["Long"].iloc[column])
+        zoom = 3
+    return gen_map(map_data, zoom, lat, lon, map_disp_type)
+
+
 @app.callback(
     [
-        Output("map-graph", "figure"),
         Output("line-graph", "figure"),
         Output("bar-graph", "figure"),
     ],
     [
-        Input("datatable", "data"),
-        Input("datatable", "selected_rows"),
+        Input("datatable", "selected_row_ids"),
         Input("graph-line", "value"),
-        Input("map-disp-type", "value"),
     ],
 )
-def map_selection(data, selected_rows, graph_line, map_disp_type):
-    aux = pd.DataFrame(data)
-    temp_df = aux.iloc[selected_rows, :]
-    zoom = 1
-    if len(selected_rows) == 0:
-        fig1 = draw_singleCountry_Scatter(
-            df_confirmed_t, df_deaths_t, df_recovered_t, df_active_t, 0
-        )
-        fig2 = draw_singleCountry_Bar(
-            df_confirmed_t, df_deaths_t, df_recovered_t, df_active_t, 0, graph_line
+@metrics.timed_callback
+def map_selection(selected_row_ids, graph_line):
+    wait_for_history()
+    frames = (df_confirmed_t, df_deaths_t, df_recovered_t, df_active_t)
+    column = 0
+    if selected_row_ids:
+        # "c<code>" rows are country totals, served from the rollup frames
+        row_id = selected_row_ids[0]
+        column = int(row_id[1:])
+        if row_id.startswith("c"):
+            frames = (
+                df_country_confirmed_t,
+                df_country_deaths_t,
+                df_country_recovered_t,
+                df_country_active_t,
+            )
+    fig1 = draw_singleCountry_Scatter(*frames, column)
+    fig2 = draw_singleCountry_Bar(*frames, column, graph_line)
+    return fig1, fig2
+
+
+#############################################################################
+# Per-callback latency/payload metrics on /metrics, and the response cache
+#############################################################################
+metrics.instrument(app)
+static_assets.install(server)
+profiling.install(server)
+
+
+# Selections are counted under names that survive a data refresh, unlike the
+# row positions in the ids: "location:<Province|Country>" and "country:<name>"
+selection_names = {
+    row["id"]: "location:" + key for row, key in zip(location_rows, location_keys)
+}
+selection_names.update(
+    {row["id"]: "country:" + countries[code] for code, row in country_rows.items()}
+)
+selection_rows = {name: row_id for row_id, name in selection_names.items()}
+# Outside the source tree by default; point WARMUP_COUNTS_FILE at persistent
+# storage shared by the workers to keep the counts across reboots and deploys
+selection_counts = warmup.SelectionCounts(
+    os.environ.get(
+        "WARMUP_COUNTS_FILE",
+        os.path.join(tempfile.gettempdir(), "covid19-selection-counts.json"),
+    )
+)
+# before the response cache, which answers hits without running later hooks
+selection_counts.install(
+    server,
+    "datatable.selected_row_ids",
+    lambda row_id: selection_names.get(str(row_id)),
+    "map-graph.figure",
+)
+
+
+warmup_enabled = os.environ.get("WARMUP", "1") != "0"
+# callback requests sent by the last warm-up, None until one has finished
+warm_requests = None
+# answered from the latest days alone, without waiting for the history
+latest_outputs = {"map-graph.figure"}
+
+
+warm_done = threading.Event()
+
+
+def warm_cache(top_k=int(os.environ.get("WARMUP_TOP_K", "10")), background=True):
+    # The latest-day views first, then the time series once the history is
+    # loaded: on a thread when `background`, while the worker already serves.
+    # The top_k most selected rows, then the highest confirmed counts.
+    global warm_requests
+    warm_done.clear()
+    row_ids = [
+        selection_rows[name]
+        for name in selection_counts.top(len(selection_rows))
+        if name in selection_rows
+    ][:top_k]
+    for row in location_rows:
+        if len(row_ids) >= top_k:
+            break
+        if row["id"] not in row_ids:
+            row_ids.append(row["id"])
+    selections = [[r] for r in row_ids]
+    requests = warmup.warm(
+        app,
+        "datatable.selected_row_ids",
+        selections,
+        lambda output: output in latest_outputs,
+    )
+    warm_requests = requests
+
+    def warm_history():
+        wait_for_history()
+        requests.extend(
+            warmup.warm(
+                app,
+                "datatable.selected_row_ids",
+                selections,
+                lambda output: output not in latest_outputs,
+            )
         )
-        return gen_map(aux, zoom, 1.2833, 103.8333, map_disp_type), fig1, fig2
+        warm_done.set()
+
+    if background:
+        threading.Thread(target=warm_history, name="warm-history", daemon=True).start()
     else:
-        fig1 = draw_singleCountry_Scatter(
-            df_confirmed_t, df_deaths_t, df_recovered_t, df_active_t, selected_rows[0]
-        )
-        fig2 = draw_singleCountry_Bar(
-            df_confirmed_t,
-            df_deaths_t,
-            df_recovered_t,
-            df_active_t,
-            selected_rows[0],
-            graph_line,
-        )
-        zoom = 3
-        return (
-            gen_map(
-                aux,
-                zoom,
-                temp_df["Lat"].iloc[0],
-                temp_df["Long"].iloc[0],
-                map_disp_type,
-            ),
-            fig1,
-            fig2,
-        )
+        warm_history()
+    return requests
+
+
+# Responses depend on the data, on this code and on the settings shaping the
+# figures: a deploy of any first-party module, or a host configured with
+# another map style or data set, changes the layout and figures without a new
+# data version, so it has to change the cache keys and ETags too
+def build_version():
+    digest = hashlib.sha1()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".py"):
+            digest.update(name.encode())
+            with open(os.path.join(directory, name), "rb") as f:
+                digest.update(hashlib.sha1(f.read()).digest())
+    settings = [map_style, mapbox_access_token, self_hosted_assets, us_counties]
+    digest.update(json.dumps(settings, sort_keys=True).encode())
+    return digest.hexdigest()[:8]
+
+
+code_version = build_version()
+figure_cache = cache.ResponseCache(
+    server,
+    lambda: data_version + "-" + code_version,
+    cache_backends.from_url(os.environ.get("CACHE_URL")),
+    stale_grace=float(os.environ.get("STALE_GRACE_SECONDS", "300")),
+)
+
+
+# /healthz and /readyz: ready once the history is loaded, so no page-load
+# callback blocks in wait_for_history(), and the whole warm-up has finished;
+# the fill ratio is the share of the warm-up responses still in the cache for
+# this version
+def health_status():
+    version = figure_cache.version()
+    cached = sum(
+        figure_cache.get(cache.request_key(version, body)) is not None
+        for body in warm_requests or []
+    )
+    return {
+        "ready": history_loaded.is_set()
+        and history_error is None
+        and (warm_done.is_set() or not warmup_enabled),
+        "data_version": data_version,
+        "code_version": code_version,
+        "latest_date": latest_date.strftime("%Y-%m-%d"),
+        "data_age_days": (pd.Timestamp.now().normalize() - latest_date).days,
+        "history_loaded": history_loaded.is_set(),
+        "build_seconds": round(sum(stage_times.values()), 3),
+        "stage_seconds": {name: round(t, 3) for name, t in stage_times.items()},
+        "warmup_requests": len(warm_requests or []),
+        "cache_fill_ratio": (
+            round(cached / len(warm_requests), 3) if warm_requests else 0.0
+        ),
+        "cache_entries": len(figure_cache.backend),
+    }
+
+
+health.install(server, health_status)
 
 
 if __name__ == "__main__":
+    if warmup_enabled:
+        warm_cache()
     app.run_server()
@@ -0,0 +1,154 @@
+"""Concurrency stress test for the figure builders.
+
+    python benchmarks/concurrency.py --threads 16 --calls 300 [--through-server]
+
+Imports app.py against the fixture CSVs, computes the expected output of every
+callback case (benchmarks/run.py) serially, then replays the cases in random
+order from many threads at once. It fails if any concurrent output differs from
+the serial one, or if any module-level frame, series or array of app.py changed
+while the callbacks ran: what `gunicorn --threads N` (gthread workers) needs.
+With --through-server the requests go through the Dash endpoint and every
+Flask hook (metrics, response cache, compression) instead of the bare callbacks;
+the serial pass then bypasses the response cache, so the replays start cold.
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import plotly
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "benchmarks", "fixtures")
+
+
+def fingerprint(module):
+    # hash of every pandas/numpy object held at module level
+    digests = {}
+    for name, value in vars(module).items():
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            digest = hashlib.sha1(
+                pd.util.hash_pandas_object(value, index=True).values.tobytes()
+            )
+            digest.update(repr(list(getattr(value, "columns", []))).encode())
+        elif isinstance(value, pd.Index):
+            digest = hashlib.sha1(pd.util.hash_pandas_object(value).values.tobytes())
+        elif isinstance(value, np.ndarray):
+            digest = hashlib.sha1(np.ascontiguousarray(value).tobytes())
+        else:
+            continue
+        digests[name] = digest.hexdigest()
+    return digests
+
+
+def direct_call(app, callback_name, inputs):
+    func = getattr(app, callback_name)
+    with app.server.test_request_context():
+        output = func(*inputs)
+    return json.dumps(output, cls=plotly.utils.PlotlyJSONEncoder, sort_keys=True)
+
+
+def direct_cases(app):
+    country = next(iter(app.country_rows.values()))["id"]
+    cases = []
+    for graph_type in ["Total Cases", "Daily Cases"]:
+        cases.append(("update_graph", (graph_type,)))
+    for high10_type in ["Confirmed Cases", "Deceased Cases"]:
+        cases.append(("update_graph_high10", (high10_type,)))
+    for row_ids in ([], [app.location_rows[0]["id"]], ["l3"], [country]):
+        for map_disp_type in ["confirmed", "active", "deaths", "recovered"]:
+            cases.append(("update_map", (row_ids, map_disp_type)))
+        for graph_line in ["Bar Chart", "Area Chart"]:
+            cases.append(("map_selection", (row_ids, graph_line)))
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--through-server", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.environ.setdefault("COVID_DATA_DIR", FIXTURES)
+    # the replayed selections must not count towards the production warm-up
+    counts_dir = tempfile.TemporaryDirectory()
+    os.environ["WARMUP_COUNTS_FILE"] = os.path.join(
+        counts_dir.name, "selection_counts.json"
+    )
+    sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+    import app
+    import cache
+    import run
+
+    # the module-level frames are only final once the history is loaded
+    app.wait_for_history()
+    before = fingerprint(app)
+
+    if args.through_server:
+        client = app.server.test_client()
+        cases = list(run.callback_cases(app).items())
+
+        def call(case, environ=None):
+            response = client.post(
+                "/_dash-update-component", json=case[1], environ_overrides=environ
+            )
+            return response.status_code, response.get_data()
+
+        # the serial pass bypasses the response cache, so the concurrent
+        # replays build every case themselves (and share builds in flight)
+        # rather than only reading what the serial pass stored
+        expected = {
+            name: call((name, case), {cache.BYPASS_ENVIRON: True})
+            for name, case in cases
+        }
+
+    else:
+        cases = [
+            (f"{name}{inputs}", (name, inputs)) for name, inputs in direct_cases(app)
+        ]
+
+        def call(case):
+            return direct_call(app, *case[1])
+
+        expected = {name: call((name, case)) for name, case in cases}
+
+    rng = random.Random(args.seed)
+    schedule = [rng.choice(cases) for _ in range(args.calls)]
+
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(args.threads) as pool:
+        results = list(pool.map(call, schedule))
+    elapsed = time.perf_counter() - started
+
+    mismatches = sorted(
+        {
+            name
+            for (name, _), result in zip(schedule, results)
+            if result != expected[name]
+        }
+    )
+    after = fingerprint(app)
+    mutated = sorted(name for name in before if before[name] != after.get(name))
+    print(
+        f"{args.calls} calls on {args.threads} threads in {elapsed:.2f}s "
+        f"({args.calls / elapsed:.0f}/s), {len(cases)} cases"
+    )
+    for name in mismatches:
+        print(f"MISMATCH {name}")
+    for name in mutated:
+        print(f"MUTATED app.{name}")
+    return 1 if mismatches or mutated else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
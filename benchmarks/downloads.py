@@ -0,0 +1,114 @@
+"""Cold-start download benchmark: serial pd.read_csv(url) against fetch.py.
+
+    python benchmarks/downloads.py --latency 0.2 --rate 5e6 [--synthetic 5000]
+
+Serves the fixture CSVs (or synthetic ones, --synthetic LOCATIONS) from
+benchmarks/fake_source.py with the given per-response latency and bandwidth,
+then times reading the three time series one after another with
+pd.read_csv(url), as app.py used to, and with fetch.read_all() on a cold and on
+a warm (keep-alive) connection pool. The frames must be identical. --fail and
+--truncate make the server fail first attempts, which fetch.py must retry.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "benchmarks", "fixtures")
+NAMES = [
+    f"time_series_covid19_{m}_global.csv" for m in ("confirmed", "deaths", "recovered")
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-dir", default=FIXTURES)
+    parser.add_argument("--synthetic", type=int, help="locations of synthetic files")
+    parser.add_argument("--days", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--rate", type=float, default=5e6, help="bytes per second")
+    parser.add_argument("--fail", type=int, default=0)
+    parser.add_argument("--truncate", action="store_true")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+    import fake_source
+    import fetch
+    from timeseries import read_pandas as parse
+    from timeseries import timeseries_dtypes
+
+    data_dir = args.data_dir
+    if args.synthetic:
+        import synthetic
+
+        data_dir = tempfile.mkdtemp()
+        synthetic.generate(data_dir, locations=args.synthetic, days=args.days)
+    server = fake_source.serve(
+        data_dir,
+        latency=args.latency,
+        rate=args.rate,
+        fail=args.fail,
+        truncate=args.truncate,
+    )
+    base = "http://%s:%d/" % server.server_address
+    urls = [base + name for name in NAMES]
+    expected = []
+    for name in NAMES:
+        with open(os.path.join(data_dir, name), "rb") as f:
+            expected.append(parse(f))
+
+    def serial():
+        return [pd.read_csv(url, dtype=timeseries_dtypes) for url in urls]
+
+    warm_pool = fetch.ConnectionPool()
+
+    def parallel_cold():
+        return fetch.read_all(
+            urls, parse, backoff=0.05, connections=fetch.ConnectionPool()
+        )
+
+    def parallel_warm():
+        return fetch.read_all(urls, parse, backoff=0.05, connections=warm_pool)
+
+    results = {
+        "file_bytes": sum(os.path.getsize(os.path.join(data_dir, n)) for n in NAMES)
+    }
+    for name, run in [
+        ("parallel_cold", parallel_cold),
+        ("parallel_warm", parallel_warm),
+        ("serial", serial),
+    ]:
+        times = []
+        for _ in range(args.repeat):
+            server.requests.clear()
+            started = time.perf_counter()
+            try:
+                frames = run()
+            except Exception as exc:
+                results[name] = {"error": repr(exc)}
+                break
+            times.append(time.perf_counter() - started)
+            for frame, want in zip(frames, expected):
+                pd.testing.assert_frame_equal(frame, want)
+        else:
+            results[name] = {
+                "median_s": round(statistics.median(times), 3),
+                "requests": sum(server.requests.values()),
+            }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
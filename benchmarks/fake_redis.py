@@ -0,0 +1,116 @@
+"""In-process stand-in for a Redis server, enough for the dashboard's cache.
+
+    python benchmarks/fake_redis.py --port 6379
+    CACHE_URL=redis://localhost:6379/0 gunicorn app:server
+
+Speaks RESP over TCP and implements PING, AUTH, SELECT, GET, SET (EX/PX/NX),
+DEL, DBSIZE and FLUSHALL on one in-memory dict with expiry. Tests and benchmarks
+can also start it in a thread with serve().
+"""
+
+import argparse
+import socketserver
+import threading
+import time
+
+
+class Store:
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.lock = threading.Lock()
+
+    def alive(self, key):
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def execute(self, command, args):
+        with self.lock:
+            if command == "PING":
+                return "+PONG"
+            if command in ("AUTH", "SELECT", "FLUSHALL"):
+                if command == "FLUSHALL":
+                    self.data.clear()
+                    self.expires.clear()
+                return "+OK"
+            if command == "GET":
+                return self.data.get(args[0]) if self.alive(args[0]) else None
+            if command == "SET":
+                key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+                if b"NX" in options and self.alive(key):
+                    return None
+                self.data[key] = value
+                self.expires.pop(key, None)
+                for unit, scale in ((b"EX", 1), (b"PX", 1e-3)):
+                    if unit in options:
+                        ttl = float(args[2 + options.index(unit) + 1]) * scale
+                        self.expires[key] = time.monotonic() + ttl
+                return "+OK"
+            if command == "DEL":
+                removed = 0
+                for key in args:
+                    if self.alive(key):
+                        del self.data[key]
+                        self.expires.pop(key, None)
+                        removed += 1
+                return removed
+            if command == "DBSIZE":
+                return sum(self.alive(key) for key in list(self.data))
+            return Exception(f"ERR unknown command '{command}'")
+
+
+def encode(reply):
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, Exception):
+        return b"-" + str(reply).encode() + b"\r\n"
+    if isinstance(reply, str):
+        return reply.encode() + b"\r\n"
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    return b"$%d\r\n" % len(reply) + reply + b"\r\n"
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line.startswith(b"*"):
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2])
+            reply = self.server.store.execute(args[0].decode().upper(), args[1:])
+            self.wfile.write(encode(reply))
+
+
+class Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, Handler)
+        self.store = Store()
+
+
+def serve(host="127.0.0.1", port=0):
+    # start in a background thread, returns the server (server_address has the port)
+    server = Server((host, port))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    Server((args.host, args.port)).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
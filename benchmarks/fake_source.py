@@ -0,0 +1,110 @@
+"""Local stand-in for the upstream CSV host, with slow and failing responses.
+
+    python benchmarks/fake_source.py benchmarks/fixtures --port 8001 --rate 2e6
+    COVID_DATA_URL=http://localhost:8001/ gunicorn app:server
+
+Serves the files of a directory over HTTP/1.1 keep-alive, gzip-encoded when the
+client accepts it. --latency delays each response, --rate caps each response
+at that many bytes per second (sent in 64 KB chunks), --fail answers the first
+N requests for every file with 503 and --truncate cuts the first response for
+every file short, to exercise the retries. Benchmarks can also start it in a
+thread with serve().
+"""
+
+import argparse
+import gzip
+import http.server
+import os
+import threading
+import time
+from collections import Counter
+
+CHUNK = 65536
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        name = os.path.basename(self.path.split("?", 1)[0])
+        with server.lock:
+            server.requests[name] += 1
+            attempt = server.requests[name]
+        time.sleep(server.latency)
+        path = os.path.join(server.directory, name)
+        if attempt <= server.fail:
+            return self.reply(503, b"unavailable")
+        if not name or not os.path.isfile(path):
+            return self.reply(404, b"not found")
+        with open(path, "rb") as f:
+            body = f.read()
+        encoding = None
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body, encoding = gzip.compress(body, 6), "gzip"
+        truncate = server.truncate and attempt == server.fail + 1
+        self.reply(200, body, encoding, truncate)
+
+    def reply(self, status, body, encoding=None, truncate=False):
+        self.send_response(status)
+        self.send_header("Content-Type", "text/csv")
+        self.send_header("Content-Length", str(len(body)))
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.end_headers()
+        if truncate:
+            body = body[: len(body) // 2]
+            self.close_connection = True
+        for start in range(0, len(body), CHUNK):
+            self.wfile.write(body[start : start + CHUNK])
+            if self.server.rate:
+                time.sleep(CHUNK / self.server.rate)
+
+
+class Server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, directory, latency=0, rate=0, fail=0, truncate=False):
+        super().__init__(address, Handler)
+        self.directory = directory
+        self.latency = latency
+        self.rate = rate
+        self.fail = fail
+        self.truncate = truncate
+        self.requests = Counter()
+        self.lock = threading.Lock()
+
+
+def serve(directory, host="127.0.0.1", port=0, **options):
+    # start in a background thread, returns the server (server_address has the port)
+    server = Server((host, port), directory, **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("directory")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--rate", type=float, default=0, help="bytes per second")
+    parser.add_argument("--fail", type=int, default=0)
+    parser.add_argument("--truncate", action="store_true")
+    args = parser.parse_args()
+    Server(
+        (args.host, args.port),
+        args.directory,
+        args.latency,
+        args.rate,
+        args.fail,
+        args.truncate,
+    ).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Import-time report: where a worker's boot goes before it can serve.
+
+    python benchmarks/imports.py --repeat 5 --top 15 --output imports.json
+
+Runs `python -X importtime -c "import app"` in fresh interpreters against the
+fixture CSVs and sums the self time of every imported module by top-level
+package (the median over the runs). app.py's own self time is its module body,
+mostly the data preprocessing, and is reported separately from the imports.
+"""
+
+import argparse
+import collections
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "benchmarks", "fixtures")
+
+
+def parse_importtime(stderr):
+    # "import time:  self [us] | cumulative | imported package" lines
+    by_package = collections.Counter()
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, field = line[len("import time:") :].split("|")
+        name = field.strip()
+        by_package[name.split(".")[0]] += int(self_us)
+        # nested imports are indented; a top-level entry's cumulative time
+        # already includes them
+        if field[1:2] != " ":
+            total += int(cumulative_us)
+    return by_package, total
+
+
+def run_once(module):
+    env = dict(os.environ, COVID_DATA_DIR=FIXTURES, PYTHONWARNINGS="ignore")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_importtime(proc.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    runs = [run_once(args.module) for _ in range(args.repeat)]
+    packages = set().union(*(by_package for by_package, _ in runs))
+    median_s = {
+        p: statistics.median(by_package[p] for by_package, _ in runs) / 1e6
+        for p in packages
+    }
+    report = {
+        "module": args.module,
+        "total_s": statistics.median(total for _, total in runs) / 1e6,
+        "module_body_s": median_s.pop(args.module, 0.0),
+        "imports_s": sum(median_s.values()),
+        "packages_s": dict(
+            sorted(median_s.items(), key=lambda item: item[1], reverse=True)[: args.top]
+        ),
+    }
+    print(f"{args.module}: {report['total_s']:.3f}s total")
+    print(f"  module body      {report['module_body_s']:8.3f}s")
+    print(f"  imports          {report['imports_s']:8.3f}s")
+    for package, seconds in report["packages_s"].items():
+        print(f"    {package:<14} {seconds:8.3f}s")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""Daily report ingestion: full run, incremental re-run and store queries.
+
+    python benchmarks/ingest.py --days 400 --locations 4000 --workers 1 4
+
+Writes synthetic MM-DD-YYYY.csv reports in the three layouts the JHU daily
+reports went through (Province/State ... Last Update until the end of February
+2020, the same plus Latitude/Longitude until 3/21/20, then the FIPS/Admin2
+layout, with Incidence_Rate/Case-Fatality_Ratio from 5/29/20 and their later
+spelling from 11/9/20), then times daily_reports.ingest() from scratch with
+each worker count, a re-run with nothing new, a re-run with one new report,
+and read_store() queries for the last week and for one country. Pass --reports
+to ingest a checkout of csse_covid_19_daily_reports instead.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import daily_reports  # noqa: E402
+
+START = datetime.date(2020, 1, 22)
+
+
+def report(date, locations, rng):
+    country = np.array([f"Country {i % 150:03d}" for i in range(locations)])
+    province = np.array([f"Province {i:05d}" for i in range(locations)], dtype=object)
+    confirmed = rng.integers(0, 100_000, locations) * ((date - START).days + 1)
+    deaths = confirmed // 50
+    recovered = confirmed // 2
+    updated = f"{date.isoformat()}T23:59:00"
+    if date < datetime.date(2020, 3, 1):
+        return pd.DataFrame(
+            {
+                "Province/State": province,
+                "Country/Region": np.where(
+                    country == "Country 000", "Mainland China", country
+                ),
+                "Last Update": f"{date.month}/{date.day}/{date.year} 23:59",
+                "Confirmed": confirmed,
+                "Deaths": deaths,
+                "Recovered": recovered,
+            }
+        )
+    lat = rng.uniform(-60, 70, locations).round(5)
+    lon = rng.uniform(-180, 180, locations).round(5)
+    if date < datetime.date(2020, 3, 22):
+        return pd.DataFrame(
+            {
+                "Province/State": province,
+                "Country/Region": country,
+                "Last Update": updated,
+                "Confirmed": confirmed,
+                "Deaths": deaths,
+                "Recovered": recovered,
+                "Latitude": lat,
+                "Longitude": lon,
+            }
+        )
+    df = pd.DataFrame(
+        {
+            "FIPS": np.where(
+                country == "Country 001", 1000.0 + np.arange(locations), np.nan
+            ),
+            "Admin2": np.where(country == "Country 001", province, ""),
+            "Province_State": province,
+            "Country_Region": country,
+            "Last_Update": updated.replace("T", " "),
+            "Lat": lat,
+            "Long_": lon,
+            "Confirmed": confirmed,
+            "Deaths": deaths,
+            "Recovered": recovered,
+            "Active": confirmed - deaths - recovered,
+            "Combined_Key": province + ", " + country,
+        }
+    )
+    if date >= datetime.date(2020, 5, 29):
+        rate = (confirmed / 1000).round(3)
+        ratio = (100 * deaths / np.maximum(confirmed, 1)).round(3)
+        if date < datetime.date(2020, 11, 9):
+            df["Incidence_Rate"], df["Case-Fatality_Ratio"] = rate, ratio
+        else:
+            df["Incident_Rate"], df["Case_Fatality_Ratio"] = rate, ratio
+    return df
+
+
+def generate(out_dir, days, locations, seed=0):
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    for i in range(days):
+        date = START + datetime.timedelta(days=i)
+        report(date, locations, rng).to_csv(
+            os.path.join(out_dir, date.strftime("%m-%d-%Y.csv")), index=False
+        )
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, round(time.perf_counter() - started, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=400)
+    parser.add_argument("--locations", type=int, default=4000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count()])
+    parser.add_argument("--reports", help="directory of JHU daily reports")
+    args = parser.parse_args()
+    work = tempfile.mkdtemp(prefix="ingest")
+    try:
+        source = args.reports
+        if source is None:
+            source = os.path.join(work, "reports")
+            generate(source, args.days, args.locations)
+        names = sorted(
+            n for n in os.listdir(source) if daily_reports.REPORT_NAME.search(n)
+        )
+        results = {"reports": len(names)}
+        store = os.path.join(work, "store")
+        for workers in args.workers:
+            shutil.rmtree(store, ignore_errors=True)
+            summary = daily_reports.ingest(source, store, workers)
+            results[f"full_{workers}_workers"] = summary["seconds"]
+        results["rows"] = summary["rows"]
+        results["rerun_nothing_new"] = daily_reports.ingest(source, store)["seconds"]
+        # the newest report comes in again as new: one month is rewritten
+        last = os.path.join(source, names[-1])
+        os.utime(last, ns=(time.time_ns(), time.time_ns()))
+        results["rerun_one_report"] = daily_reports.ingest(source, store)["seconds"]
+        last_date = daily_reports.report_date(names[-1])
+        week, results["query_last_week"] = timed(
+            daily_reports.read_store, store, start=last_date - pd.Timedelta(days=6)
+        )
+        country = week["Country/Region"].iloc[0]
+        _, results["query_one_country"] = timed(
+            daily_reports.read_store,
+            store,
+            countries=[country],
+            columns=["Date", "Province/State", "Confirmed", "Deaths"],
+        )
+        results["store_bytes"] = sum(
+            os.path.getsize(os.path.join(root, f))
+            for root, _, files in os.walk(store)
+            for f in files
+        )
+        print(json.dumps(results, indent=2))
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""CSV parsing benchmark: pd.read_csv against pyarrow's reader (timeseries.py).
+
+    python benchmarks/parsing.py --synthetic 10000x1000 100000x1000 --repeat 3
+
+Parses the fixture CSVs (the real JHU files, or --data-dir) and synthetic wide
+files (benchmarks/synthetic.py, LOCATIONSxDAYS) with timeseries.read_pandas and
+timeseries.read_arrow, checks the frames are identical and reports the median
+time of each reader and the speedup per file. Needs pyarrow.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "benchmarks", "fixtures")
+
+
+def timed(read, path, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        with open(path, "rb") as f:
+            df = read(f)
+        times.append(time.perf_counter() - started)
+    return statistics.median(times), df
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-dir", default=FIXTURES)
+    parser.add_argument("--synthetic", nargs="*", default=["10000x1000"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+    import pandas as pd
+
+    import synthetic
+    import timeseries
+
+    if timeseries.pa is None:
+        sys.exit("pyarrow is not installed")
+    files = {
+        f"real/{name}": os.path.join(args.data_dir, name)
+        for name in sorted(os.listdir(args.data_dir))
+        if name.endswith("_global.csv")
+    }
+    tmp = tempfile.TemporaryDirectory()
+    for size in args.synthetic:
+        locations, days = map(int, size.split("x"))
+        out_dir = os.path.join(tmp.name, size)
+        synthetic.generate(out_dir, locations=locations, days=days)
+        name = "time_series_covid19_confirmed_global.csv"
+        files[f"synthetic/{size}"] = os.path.join(out_dir, name)
+
+    results = {}
+    for label, path in files.items():
+        pandas_s, expected = timed(timeseries.read_pandas, path, args.repeat)
+        arrow_s, df = timed(timeseries.read_arrow, path, args.repeat)
+        pd.testing.assert_frame_equal(df, expected)
+        results[label] = {
+            "bytes": os.path.getsize(path),
+            "shape": list(df.shape),
+            "pandas_s": round(pandas_s, 4),
+            "arrow_s": round(arrow_s, 4),
+            "speedup": round(pandas_s / arrow_s, 2),
+        }
+        print(label, results[label])
+    tmp.cleanup()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""Benchmark suite: cold start, preprocessing stages and every callback.
+
+Runs offline against the fixture CSVs in benchmarks/fixtures (JHU layout) and
+synthetic copies of them scaled up by repeating every location.
+
+    python benchmarks/run.py --scales 1 10 100 --output benchmark.json
+    python benchmarks/run.py --compare before.json after.json
+
+Each scale imports app.py in fresh processes to time the cold start and the
+stages recorded in app.stage_times, then drives every callback with every
+input combination through the Dash endpoint and records latency and bytes.
+"""
+
+import argparse
+import csv
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "benchmarks", "fixtures")
+METRICS = ["confirmed", "deaths", "recovered"]
+
+
+def fixture_name(metric):
+    return f"time_series_covid19_{metric}_global.csv"
+
+
+def scale_fixtures(factor, out_dir):
+    # Repeat every location `factor` times under new province names, identically in
+    # all three files so confirmed/deaths/recovered rows still line up
+    for metric in METRICS:
+        with open(os.path.join(FIXTURES, fixture_name(metric)), newline="") as f:
+            header, *rows = list(csv.reader(f))
+        with open(os.path.join(out_dir, fixture_name(metric)), "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            for k in range(factor):
+                for row in rows:
+                    if k:
+                        row = list(row)
+                        row[0] = f"{row[0] or row[1]} #{k}"
+                        if row[2]:
+                            row[2] = f"{float(row[2]) + k * 1e-3:.5f}"
+                    writer.writerow(row)
+    return out_dir
+
+
+#############################################################################
+# Worker: runs inside a fresh interpreter with COVID_DATA_DIR set
+#############################################################################
+
+
+def dash_request(outputs, inputs):
+    outputs = [{"id": i, "property": p} for i, p in outputs]
+    inputs = [{"id": i, "property": p, "value": v} for i, p, v in inputs]
+    if len(outputs) == 1:
+        output = "{id}.{property}".format(**outputs[0])
+        outputs = outputs[0]
+    else:
+        output = (
+            ".." + "...".join("{id}.{property}".format(**o) for o in outputs) + ".."
+        )
+    return {
+        "output": output,
+        "outputs": outputs,
+        "inputs": inputs,
+        "changedPropIds": ["{id}.{property}".format(**i) for i in inputs],
+    }
+
+
+def callback_cases(app):
+    cases = {}
+    for graph_type in ["Total Cases", "Daily Cases"]:
+        cases[f"update_graph[{graph_type}]"] = dash_request(
+            [("global-graph", "figure")], [("graph-type", "value", graph_type)]
+        )
+    for high10_type in ["Confirmed Cases", "Deceased Cases"]:
+        cases[f"update_graph_high10[{high10_type}]"] = dash_request(
+            [("high10-graph", "figure")],
+            [("graph-high10-type", "value", high10_type)],
+        )
+    selections = {
+        "none": [],
+        "location": [app.location_rows[0]["id"]],
+        "country": [next(iter(app.country_rows.values()))["id"]],
+    }
+    for selection, row_ids in selections.items():
+        for map_disp_type in ["confirmed", "active", "deaths", "recovered"]:
+            cases[f"update_map[{selection}|{map_disp_type}]"] = dash_request(
+                [("map-graph", "figure")],
+                [
+                    ("datatable", "selected_row_ids", row_ids),
+                    ("map-disp-type", "value", map_disp_type),
+                ],
+            )
+        for graph_line in ["Bar Chart", "Area Chart"]:
+            cases[f"map_selection[{selection}|{graph_line}]"] = dash_request(
+                [("line-graph", "figure"), ("bar-graph", "figure")],
+                [
+                    ("datatable", "selected_row_ids", row_ids),
+                    ("graph-line", "value", graph_line),
+                ],
+            )
+    return cases
+
+
+def encoded_sizes(client, method, path, **kwargs):
+    # bytes on the wire for a browser accepting brotli, and for gzip only
+    return {
+        f"{encoding}_bytes": len(
+            client.open(
+                path, method=method, headers={"Accept-Encoding": encoding}, **kwargs
+            ).data
+        )
+        for encoding in ("br", "gzip")
+    }
+
+
+def worker(rounds):
+    sys.path.insert(0, ROOT)
+    started = time.perf_counter()
+    import app
+    import cache
+
+    import_s = time.perf_counter() - started
+    app.wait_for_history()
+    result = {
+        "import_s": import_s,
+        "history_s": time.perf_counter() - started,
+        "stages_s": dict(app.stage_times),
+        "locations": len(app.map_data),
+        "dates": len(app.dates),
+    }
+    if rounds:
+        client = app.server.test_client()
+        layout = client.get("/_dash-layout")
+        result["layout_bytes"] = len(layout.data)
+        for name, size in encoded_sizes(client, "GET", "/_dash-layout").items():
+            result["layout_" + name] = size
+        revalidated = client.get(
+            "/_dash-layout", headers={"If-None-Match": layout.headers["ETag"]}
+        )
+        result["layout_revalidate_bytes"] = len(revalidated.data)
+        result["callbacks"] = {}
+        # latency_s and p95_s time the figure builders, with the response cache
+        # bypassed; cached_latency_s times the hits
+        uncached = {cache.BYPASS_ENVIRON: True}
+        for name, body in callback_cases(app).items():
+            payload = json.dumps(body)
+            timings = []
+            for _ in range(rounds + 1):
+                t0 = time.perf_counter()
+                resp = client.post(
+                    "/_dash-update-component",
+                    data=payload,
+                    content_type="application/json",
+                    environ_overrides=uncached,
+                )
+                timings.append(time.perf_counter() - t0)
+                assert resp.status_code == 200, (name, resp.status_code)
+            first, timings = timings[0], sorted(timings[1:])
+            cached = []
+            for _ in range(rounds + 1):
+                t0 = time.perf_counter()
+                client.post(
+                    "/_dash-update-component",
+                    data=payload,
+                    content_type="application/json",
+                )
+                cached.append(time.perf_counter() - t0)
+            # the first of these fills the cache
+            cached = cached[1:]
+            compressed = []
+            for _ in range(rounds):
+                t0 = time.perf_counter()
+                client.post(
+                    "/_dash-update-component",
+                    data=payload,
+                    content_type="application/json",
+                    headers={"Accept-Encoding": "br, gzip"},
+                )
+                compressed.append(time.perf_counter() - t0)
+            result["callbacks"][name] = {
+                "first_call_s": first,
+                "latency_s": statistics.median(timings),
+                "p95_s": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+                "cached_latency_s": statistics.median(cached),
+                "compressed_latency_s": statistics.median(compressed),
+                "request_bytes": len(payload),
+                "response_bytes": len(resp.data),
+                **encoded_sizes(
+                    client,
+                    "POST",
+                    "/_dash-update-component",
+                    data=payload,
+                    content_type="application/json",
+                ),
+            }
+    json.dump(result, sys.stdout)
+
+
+#############################################################################
+# Driver
+#############################################################################
+
+
+def run_worker(data_dir, rounds):
+    env = dict(os.environ, COVID_DATA_DIR=data_dir, PYTHONWARNINGS="ignore")
+    started = time.perf_counter()
+    out = subprocess.run(
+        [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--worker",
+            "--rounds",
+            str(rounds),
+        ],
+        cwd=ROOT,
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    result = json.loads(out)
+    result["cold_start_s"] = time.perf_counter() - started
+    return result
+
+
+def median_of(results, key):
+    return statistics.median(r[key] for r in results)
+
+
+def benchmark_scale(data_dir, repeat, rounds):
+    # callbacks are timed in the first process only, the others time the cold start
+    results = [run_worker(data_dir, rounds if i == 0 else 0) for i in range(repeat)]
+    return {
+        "locations": results[0]["locations"],
+        "dates": results[0]["dates"],
+        "cold_start_s": median_of(results, "cold_start_s"),
+        "import_s": median_of(results, "import_s"),
+        "history_s": median_of(results, "history_s"),
+        "stages_s": {
+            stage: statistics.median(r["stages_s"][stage] for r in results)
+            for stage in results[0]["stages_s"]
+        },
+        **{
+            key: value for key, value in results[0].items() if key.startswith("layout_")
+        },
+        "callbacks": results[0].get("callbacks", {}),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        return None
+
+
+def flatten(tree, prefix=""):
+    flat = {}
+    for key, value in tree.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and value is not None:
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(before_path, after_path, threshold, floor):
+    with open(before_path) as f:
+        before = flatten(json.load(f)["results"])
+    with open(after_path) as f:
+        after = flatten(json.load(f)["results"])
+    regressions = []
+    for key in sorted(before.keys() & after.keys()):
+        old, new = before[key], after[key]
+        if key.endswith(("locations", "dates")) or not old:
+            continue
+        ratio = new / old
+        # timings below the floor are too noisy to call a regression
+        noisy = key.endswith("_s") and max(old, new) < floor
+        flag = ""
+        if ratio > 1 + threshold and not noisy:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        print(f"{key:70s} {old:14.6g} {new:14.6g} {ratio:7.2f}x{flag}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--repeat", type=int, default=3, help="cold starts per scale")
+    parser.add_argument("--rounds", type=int, default=5, help="calls per callback case")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--floor", type=float, default=0.001)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return worker(args.rounds)
+    if args.compare:
+        sys.exit(compare(*args.compare, args.threshold, args.floor))
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        # the replayed selections must not count towards the production warm-up
+        os.environ["WARMUP_COUNTS_FILE"] = os.path.join(tmp, "selection_counts.json")
+        for scale in args.scales:
+            if scale == 1:
+                data_dir = FIXTURES
+            else:
+                data_dir = scale_fixtures(scale, tempfile.mkdtemp(dir=tmp))
+            results[f"x{scale}"] = benchmark_scale(data_dir, args.repeat, args.rounds)
+            print(
+                f"x{scale}: {results[f'x{scale}']['locations']} locations, "
+                f"cold start {results[f'x{scale}']['cold_start_s']:.3f}s",
+                file=sys.stderr,
+            )
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""Scale harness: runs the full app.py pipeline on synthetic data until it breaks.
+
+    python benchmarks/scale.py --locations 10000 100000 1000000 --days 3650
+
+For every size it generates synthetic CSVs (benchmarks/synthetic.py), imports
+app.py in a child process under a time and memory limit, then calls the map,
+graph and table callbacks once. Each run reports the preprocessing stage
+timings, callback timings, peak RSS and, if the child ran out of time or
+memory, the app.py line it was executing.
+"""
+
+import argparse
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import synthetic  # noqa: E402
+
+APP_FRAME = re.compile(r'File "(?P<file>[^"]*app\.py)", line (?P<line>\d+)')
+
+
+def app_line(text):
+    # innermost app.py frame of a traceback or a faulthandler dump
+    frames = list(APP_FRAME.finditer(text))
+    if not frames:
+        return None
+    # faulthandler lists the innermost frame first, tracebacks list it last
+    match = frames[0] if "most recent call first" in text else frames[-1]
+    line = int(match.group("line"))
+    with open(match.group("file")) as f:
+        source = f.read().splitlines()[line - 1].strip()
+    return {"line": line, "source": source}
+
+
+def timed(result, name, func):
+    started = time.perf_counter()
+    value = func()
+    result["callbacks_s"][name] = time.perf_counter() - started
+    return value
+
+
+def child(timeout):
+    import faulthandler
+
+    # dump where every thread is and exit just before the parent gives up
+    faulthandler.dump_traceback_later(max(1, timeout - 5), exit=True)
+    sys.path.insert(0, ROOT)
+    result = {"callbacks_s": {}}
+    try:
+        started = time.perf_counter()
+        import app
+
+        result["import_s"] = time.perf_counter() - started
+        app.wait_for_history()
+        result["history_s"] = time.perf_counter() - started
+        result["stages_s"] = dict(app.stage_times)
+        country = next(iter(app.country_rows))
+        timed(result, "update_map[none]", lambda: app.update_map([], "confirmed"))
+        timed(
+            result,
+            "map_selection[none]",
+            lambda: app.map_selection([], "Bar Chart"),
+        )
+        timed(
+            result,
+            "map_selection[country]",
+            lambda: app.map_selection(["c" + str(country)], "Bar Chart"),
+        )
+        timed(result, "update_graph", lambda: app.update_graph("Daily Cases"))
+        timed(
+            result,
+            "update_graph_high10",
+            lambda: app.update_graph_high10("Confirmed Cases"),
+        )
+        timed(
+            result,
+            "update_table[drill-down]",
+            lambda: app.update_table(
+                "Country drill-down", None, list(app.province_rows), []
+            ),
+        )
+        client = app.server.test_client()
+        layout = timed(result, "layout", lambda: client.get("/_dash-layout"))
+        result["layout_bytes"] = len(layout.data)
+    except BaseException as exc:  # MemoryError included
+        result["error"] = repr(exc)
+        result["where"] = app_line(traceback.format_exc())
+    result["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    json.dump(result, sys.stdout)
+
+
+def run_child(data_dir, timeout, memory_gb):
+    def limit_memory():
+        if memory_gb:
+            size = int(memory_gb * 1024**3)
+            resource.setrlimit(resource.RLIMIT_AS, (size, size))
+
+    env = dict(
+        os.environ,
+        COVID_DATA_DIR=data_dir,
+        PYTHONWARNINGS="ignore",
+        # the selections made here must not count towards the production warm-up
+        WARMUP_COUNTS_FILE=os.path.join(data_dir, "selection_counts.json"),
+    )
+    started = time.perf_counter()
+    try:
+        proc = subprocess.run(
+            [
+                sys.executable,
+                os.path.abspath(__file__),
+                "--child",
+                "--timeout",
+                str(timeout),
+            ],
+            cwd=ROOT,
+            env=env,
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+            preexec_fn=limit_memory,
+        )
+    except subprocess.TimeoutExpired as exc:
+        stderr = (
+            exc.stderr.decode() if isinstance(exc.stderr, bytes) else exc.stderr or ""
+        )
+        return {"error": "timeout", "where": app_line(stderr), "wall_s": timeout}
+    try:
+        result = json.loads(proc.stdout)
+    except ValueError:
+        # killed by faulthandler (timeout) or by the kernel (memory) before reporting
+        result = {
+            "error": (
+                "timeout" if "Timeout" in proc.stderr else f"exit {proc.returncode}"
+            ),
+            "where": app_line(proc.stderr),
+        }
+    result["wall_s"] = time.perf_counter() - started
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--locations", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--days", type=int, default=3650)
+    parser.add_argument("--sparsity", type=float, default=0.5)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument(
+        "--memory-gb", type=float, default=0, help="address space limit"
+    )
+    parser.add_argument("--output", default="scale.json")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child(args.timeout)
+
+    runs = []
+    for locations in args.locations:
+        with tempfile.TemporaryDirectory() as data_dir:
+            started = time.perf_counter()
+            synthetic.generate(
+                data_dir, locations=locations, days=args.days, sparsity=args.sparsity
+            )
+            run = {
+                "locations": locations,
+                "days": args.days,
+                "generate_s": time.perf_counter() - started,
+            }
+            run.update(run_child(data_dir, args.timeout, args.memory_gb))
+        runs.append(run)
+        status = run.get("error") or "ok"
+        print(f"{locations} locations x {args.days} days: {status}", file=sys.stderr)
+        with open(args.output, "w") as f:
+            json.dump(runs, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
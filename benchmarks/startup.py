@@ -0,0 +1,117 @@
+"""Startup benchmark: time-to-ready and per-worker unique RSS under gunicorn.
+
+    python benchmarks/startup.py --workers 4
+    python benchmarks/startup.py --workers 4 --no-preload
+
+Unique RSS (USS) is Private_Clean + Private_Dirty from /proc/<pid>/smaps_rollup,
+i.e. the memory a worker does not share with the master or its siblings.
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def children(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(p) for p in f.read().split()]
+
+
+def memory_kb(pid):
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "rss_kb": fields.get("Rss", 0),
+        "pss_kb": fields.get("Pss", 0),
+        "uss_kb": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+def wait_ready(url, deadline):
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=5) as resp:
+                if resp.status == 200:
+                    return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+
+def exercise(base, rounds):
+    # Touch every worker a few times so reads of the shared frames show up in USS
+    for _ in range(rounds):
+        urllib.request.urlopen(base + "/_dash-layout", timeout=30).read()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--no-preload", action="store_true")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    port = free_port()
+    # the requests made here must not count towards the production warm-up
+    counts_dir = tempfile.TemporaryDirectory()
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        WEB_CONCURRENCY=str(args.workers),
+        PRELOAD_APP="0" if args.no_preload else "1",
+        WARMUP_COUNTS_FILE=os.path.join(counts_dir.name, "selection_counts.json"),
+    )
+    base = f"http://127.0.0.1:{port}"
+    start = time.time()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "app:server"],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        if not wait_ready(base + "/", start + args.timeout):
+            sys.exit("gunicorn did not become ready")
+        time_to_ready = time.time() - start
+        while len(children(proc.pid)) < args.workers:
+            time.sleep(0.05)
+        exercise(base, args.requests)
+        workers = {pid: memory_kb(pid) for pid in children(proc.pid)}
+        result = {
+            "preload": not args.no_preload,
+            "workers": args.workers,
+            "time_to_ready_s": round(time_to_ready, 3),
+            "master": memory_kb(proc.pid),
+            "worker_memory": workers,
+            "mean_worker_uss_kb": sum(w["uss_kb"] for w in workers.values())
+            // len(workers),
+        }
+        print(json.dumps(result, indent=2))
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait()
+
+
+if __name__ == "__main__":
+    main()
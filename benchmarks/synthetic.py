@@ -0,0 +1,202 @@
+"""Synthetic JHU-layout time series for scale testing.
+
+Writes time_series_covid19_{confirmed,deaths,recovered}_global.csv with the same
+columns as the JHU files (Province/State, Country/Region, Lat, Long, one column
+per day) for any number of locations and days.
+
+    python benchmarks/synthetic.py /tmp/synthetic --locations 100000 --days 3650
+
+--sparsity is the fraction of days without new cases at a location and
+--recovered-missing the fraction of locations left out of the recovered file,
+as happens in the real data.
+
+--us-counties N also writes time_series_covid19_{confirmed,deaths}_US.csv in the
+layout of the JHU county files (UID, iso2, iso3, code3, FIPS, Admin2,
+Province_State, Country_Region, Lat, Long_, Combined_Key, Population in the
+deaths file only, then the days), for US_COUNTIES=1:
+
+    python benchmarks/synthetic.py /tmp/us --locations 200 --days 400 --us-counties 33000
+"""
+
+import argparse
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+
+METRICS = ["confirmed", "deaths", "recovered"]
+INT32_MAX = np.iinfo(np.int32).max
+
+
+def date_columns(days, start=datetime.date(2020, 1, 22)):
+    return [
+        f"{d.month}/{d.day}/{d.year % 100}"
+        for d in (start + datetime.timedelta(days=i) for i in range(days))
+    ]
+
+
+def location_names(rng, locations, countries):
+    # India is always present, the dashboard moves it to the top of the table;
+    # the first location of every country is its national row without a province
+    country_names = np.array(
+        ["India"] + [f"Country {i:04d}" for i in range(1, countries)]
+    )
+    country = rng.integers(0, countries, size=locations)
+    country[: min(countries, locations)] = np.arange(min(countries, locations))
+    province = np.array([f"Province {i:07d}" for i in range(locations)], dtype=object)
+    province[: min(countries, locations)] = ""
+    return province, country_names[country]
+
+
+def generate(
+    out_dir,
+    locations=10_000,
+    days=3650,
+    sparsity=0.5,
+    countries=200,
+    recovered_missing=0.05,
+    seed=0,
+    chunk=2000,
+):
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    header = ["Province/State", "Country/Region", "Lat", "Long"] + date_columns(days)
+    paths = {
+        m: os.path.join(out_dir, f"time_series_covid19_{m}_global.csv") for m in METRICS
+    }
+    for path in paths.values():
+        pd.DataFrame(columns=header).to_csv(path, index=False)
+
+    province, country = location_names(rng, locations, max(1, countries))
+    keep_recovered = rng.random(locations) >= recovered_missing
+    for start in range(0, locations, chunk):
+        stop = min(start + chunk, locations)
+        n = stop - start
+        rate = rng.lognormal(mean=1.0, sigma=2.0, size=(n, 1))
+        new = rng.poisson(rate, size=(n, days)) * (rng.random((n, days)) >= sparsity)
+        counts = {
+            "confirmed": np.cumsum(new, axis=1),
+            "deaths": np.cumsum(rng.binomial(new, 0.02), axis=1),
+            "recovered": np.cumsum(rng.binomial(new, 0.8), axis=1),
+        }
+        meta = pd.DataFrame(
+            {
+                "Province/State": province[start:stop],
+                "Country/Region": country[start:stop],
+                "Lat": rng.uniform(-60, 70, n).round(5),
+                "Long": rng.uniform(-180, 180, n).round(5),
+            }
+        )
+        for metric in METRICS:
+            block = pd.concat(
+                [
+                    meta,
+                    pd.DataFrame(
+                        np.minimum(counts[metric], INT32_MAX).astype(np.int32),
+                        columns=header[4:],
+                    ),
+                ],
+                axis=1,
+            )
+            if metric == "recovered":
+                block = block[keep_recovered[start:stop]]
+            block.to_csv(paths[metric], mode="a", header=False, index=False)
+    return paths
+
+
+def generate_us(out_dir, counties=3300, days=3650, sparsity=0.5, seed=0, chunk=2000):
+    rng = np.random.default_rng(seed + 1)
+    os.makedirs(out_dir, exist_ok=True)
+    meta_columns = [
+        "UID",
+        "iso2",
+        "iso3",
+        "code3",
+        "FIPS",
+        "Admin2",
+        "Province_State",
+        "Country_Region",
+        "Lat",
+        "Long_",
+        "Combined_Key",
+    ]
+    dates = date_columns(days)
+    paths = {
+        m: os.path.join(out_dir, f"time_series_covid19_{m}_US.csv")
+        for m in ("confirmed", "deaths")
+    }
+    pd.DataFrame(columns=meta_columns + dates).to_csv(paths["confirmed"], index=False)
+    pd.DataFrame(columns=meta_columns + ["Population"] + dates).to_csv(
+        paths["deaths"], index=False
+    )
+    for start in range(0, counties, chunk):
+        stop = min(start + chunk, counties)
+        n = stop - start
+        fips = 1000 + np.arange(start, stop)
+        county = np.array([f"County {i:05d}" for i in range(start, stop)])
+        state = np.array([f"State {i:02d}" for i in rng.integers(0, 56, n)])
+        meta = pd.DataFrame(
+            {
+                "UID": 84000000 + fips,
+                "iso2": "US",
+                "iso3": "USA",
+                "code3": 840,
+                "FIPS": fips.astype(float),
+                "Admin2": county,
+                "Province_State": state,
+                "Country_Region": "US",
+                "Lat": rng.uniform(25, 49, n).round(5),
+                "Long_": rng.uniform(-125, -67, n).round(5),
+                "Combined_Key": pd.Series(county) + ", " + state + ", US",
+            }
+        )
+        rate = rng.lognormal(mean=1.0, sigma=2.0, size=(n, 1))
+        new = rng.poisson(rate, size=(n, days)) * (rng.random((n, days)) >= sparsity)
+        confirmed = np.minimum(np.cumsum(new, axis=1), INT32_MAX).astype(np.int32)
+        deaths = np.cumsum(rng.binomial(new, 0.02), axis=1).astype(np.int32)
+        pd.concat([meta, pd.DataFrame(confirmed, columns=dates)], axis=1).to_csv(
+            paths["confirmed"], mode="a", header=False, index=False
+        )
+        pd.concat(
+            [
+                meta.assign(Population=rng.integers(1000, 10_000_000, n)),
+                pd.DataFrame(deaths, columns=dates),
+            ],
+            axis=1,
+        ).to_csv(paths["deaths"], mode="a", header=False, index=False)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("out_dir")
+    parser.add_argument("--locations", type=int, default=10_000)
+    parser.add_argument("--days", type=int, default=3650)
+    parser.add_argument("--sparsity", type=float, default=0.5)
+    parser.add_argument("--countries", type=int, default=200)
+    parser.add_argument("--recovered-missing", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--us-counties", type=int, default=0)
+    args = parser.parse_args()
+    generate(
+        args.out_dir,
+        locations=args.locations,
+        days=args.days,
+        sparsity=args.sparsity,
+        countries=args.countries,
+        recovered_missing=args.recovered_missing,
+        seed=args.seed,
+    )
+    if args.us_counties:
+        generate_us(
+            args.out_dir,
+            counties=args.us_counties,
+            days=args.days,
+            sparsity=args.sparsity,
+            seed=args.seed,
+        )
+
+
+if __name__ == "__main__":
+    main()
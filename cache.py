@@ -0,0 +1,293 @@
+import gzip
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import brotli
+import flask
+
+import cache_backends
+import metrics
+
+#############################################################################
+# Callback response cache. Every callback in the dashboard is a pure function
+# of (data version, inputs, state), so its serialized JSON response can be
+# reused for any user sending the same values. Entries hold the JSON along
+# with its brotli and gzip encodings, compressed once when stored, so a hit
+# skips the figure building, the JSON encoding and the compression. The
+# layout (with the KPIs and leaderboards) is cached the same way, per version.
+# Entries live in a cache_backends backend, shared across workers and hosts
+# when CACHE_URL points at a disk directory or a Redis server.
+# The same key is sent as the ETag, with "Cache-Control: no-cache" so clients
+# revalidate; the layout and dependencies (GET) answer a matching
+# If-None-Match with 304. Callbacks are POSTs, where a conditional request
+# must not produce a 304, so they only carry the headers.
+# Misses are single-flight: while one request builds a response, identical
+# requests wait for it and are then served from the cache ("coalesced").
+# After a data refresh (a new version), a figure not built yet for the new
+# version is served from the previous version's entry for `stale_grace`
+# seconds ("stale") while a background request rebuilds it. Workers learn
+# which version they replaced from a record kept in the backend.
+#############################################################################
+
+DASH_UPDATE_PATH = "/_dash-update-component"
+CONDITIONAL_PATHS = ("/_dash-layout", "/_dash-dependencies")
+ENCODINGS = ("br", "gzip")
+# the ETag of a compressed response ends in ":<encoding>", as Flask-Compress does
+ETAG_SUFFIXES = ("", ":br", ":gzip")
+VERSION_RECORD = "versions"
+# sent by the background rebuild, which must not be answered with a stale entry
+REVALIDATE_HEADER = "X-Cache-Revalidate"
+# WSGI environ key making a callback request skip the cache, for in-process
+# callers such as the benchmarks (test_client(environ_overrides=...)); unlike a
+# header, remote clients cannot set it
+BYPASS_ENVIRON = "covid19.cache_bypass"
+STALE_AGE_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+
+metrics.describe(
+    "dash_callback_stale_age_seconds",
+    "Time since the data version changed, for each stale response served.",
+)
+metrics.describe("cache_revalidations_total", "Background rebuilds of stale responses.")
+
+
+def request_key(version, body):
+    values = [
+        body.get("output"),
+        [i.get("value") if isinstance(i, dict) else i for i in body.get("inputs", [])],
+        [s.get("value") if isinstance(s, dict) else s for s in body.get("state", [])],
+    ]
+    encoded = json.dumps(values, sort_keys=True, separators=(",", ":"), default=str)
+    return version + ":" + hashlib.sha1(encoded.encode()).hexdigest()
+
+
+def encode(body, config):
+    # same threshold and levels as Flask-Compress uses for live responses
+    payloads = {"identity": body}
+    if len(body) >= config.get("COMPRESS_MIN_SIZE", 1024):
+        payloads["br"] = brotli.compress(
+            body, quality=config.get("COMPRESS_BR_LEVEL", 4)
+        )
+        payloads["gzip"] = gzip.compress(
+            body, compresslevel=config.get("COMPRESS_LEVEL", 6), mtime=0
+        )
+    return payloads
+
+
+class SingleFlight:
+    # One build per key at a time. Requests in this process wait on the
+    # leader's Event; the leader itself takes the backend's lock, and if
+    # another process holds it, polls the backend until that result lands.
+    # After `timeout` seconds a waiter gives up and builds the response itself.
+    def __init__(self, backend, timeout=30, poll=0.02):
+        self.backend = backend
+        self.timeout = timeout
+        self.poll = poll
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def start(self, key):
+        # True: the caller builds the response and must call finish(key)
+        with self._lock:
+            event = self._flights.get(key)
+            if event is None:
+                self._flights[key] = threading.Event()
+        if event is not None:
+            event.wait(self.timeout)
+            return False
+        if self.backend.acquire(key, self.timeout):
+            return True
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            if self.backend.get(key) is not None or not self.backend.locked(key):
+                break
+            time.sleep(self.poll)
+        self._wake(key)
+        return False
+
+    def finish(self, key):
+        self.backend.release(key)
+        self._wake(key)
+
+    def _wake(self, key):
+        with self._lock:
+            event = self._flights.pop(key, None)
+        if event is not None:
+            event.set()
+
+
+class ResponseCache:
+    def __init__(self, server, version, backend=None, max_entries=512, stale_grace=300):
+        # version: callable returning the current data version
+        self.server = server
+        self.version = version
+        if backend is None:
+            backend = cache_backends.MemoryBackend(max_entries)
+        self.backend = backend
+        self.flights = SingleFlight(self.backend)
+        self.stale_grace = stale_grace
+        self.previous = None
+        self.changed_at = 0
+        self._revalidating = set()
+        self._revalidate_lock = threading.Lock()
+        self._revalidator = ThreadPoolExecutor(2, thread_name_prefix="revalidate")
+        server.before_request(self.lookup)
+        server.after_request(self.store)
+        server.teardown_request(self.finish)
+        self.adopt_version()
+
+    def adopt_version(self):
+        # The first process of a new version records it, with the one it
+        # replaces; later processes read the same record
+        current = self.version()
+        record = self.backend.get(VERSION_RECORD) or {}
+        if record.get("current", b"").decode() == current:
+            previous = record.get("previous", b"").decode()
+            changed_at = float(record.get("changed_at", b"0"))
+        else:
+            previous, changed_at = record.get("current", b"").decode(), time.time()
+            self.backend.set(
+                VERSION_RECORD,
+                {
+                    "current": current.encode(),
+                    "previous": previous.encode(),
+                    "changed_at": repr(changed_at).encode(),
+                },
+            )
+        if previous:
+            self.retire(previous, changed_at)
+
+    def retire(self, version, changed_at=None):
+        # entries of `version` may be served stale for stale_grace seconds
+        self.previous = version
+        self.changed_at = changed_at or time.time()
+
+    def stale(self, body):
+        # previous version's entry for a figure, while in the grace period
+        age = time.time() - self.changed_at
+        if (
+            self.previous is None
+            or age > self.stale_grace
+            or ".figure" not in body.get("output", "")
+            or flask.request.headers.get(REVALIDATE_HEADER)
+        ):
+            return None, None
+        key = request_key(self.previous, body)
+        payloads = self.get(key)
+        if payloads is not None:
+            metrics.observe("dash_callback_stale_age_seconds", age, STALE_AGE_BUCKETS)
+        return key, payloads
+
+    def revalidate(self, key, body):
+        # rebuild in the background through the full request path, once per key
+        with self._revalidate_lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+        path = flask.request.path
+
+        def rebuild():
+            try:
+                self.server.test_client().post(
+                    path, json=body, headers={REVALIDATE_HEADER: "1"}
+                )
+                metrics.increment("cache_revalidations_total")
+            finally:
+                with self._revalidate_lock:
+                    self._revalidating.discard(key)
+
+        self._revalidator.submit(rebuild)
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, payloads):
+        self.backend.set(key, payloads)
+
+    def not_modified(self, etag):
+        for suffix in ETAG_SUFFIXES:
+            if flask.request.if_none_match.contains_weak(etag + suffix):
+                response = flask.Response(status=304)
+                response.set_etag(etag + suffix)
+                response.headers["Cache-Control"] = "no-cache"
+                return response
+        return None
+
+    def lookup(self):
+        path = flask.request.path
+        if path.endswith(CONDITIONAL_PATHS) and flask.request.method == "GET":
+            key = self.version() + ":" + path.rsplit("/", 1)[1]
+            flask.g.etag = key
+            not_modified = self.not_modified(key)
+            if not_modified is not None:
+                return not_modified
+        elif path.endswith(DASH_UPDATE_PATH):
+            # set by the profiler and the benchmarks, which need the callback
+            # to actually run
+            if flask.g.get("cache_bypass") or flask.request.environ.get(BYPASS_ENVIRON):
+                return None
+            body = flask.request.get_json(silent=True)
+            if not body:
+                return None
+            key = request_key(self.version(), body)
+            flask.g.etag = key
+        else:
+            return None
+        payloads = self.get(key)
+        status = "hit"
+        if payloads is None and path.endswith(DASH_UPDATE_PATH):
+            stale_key, payloads = self.stale(body)
+            if payloads is not None:
+                self.revalidate(key, body)
+                flask.g.etag = stale_key
+                status = "stale"
+        if payloads is None:
+            if self.flights.start(key):
+                flask.g.flight_key = key
+            else:
+                payloads = self.get(key)
+                status = "coalesced"
+        if payloads is None:
+            flask.g.cache_key = key
+            flask.g.cache_status = "miss"
+            return None
+        flask.g.cache_status = status
+        flask.g.cache_payloads = payloads
+        response = flask.Response(payloads["identity"], mimetype="application/json")
+        if status == "stale":
+            response.headers["X-Cache"] = "stale"
+        return response
+
+    def store(self, response):
+        key = flask.g.pop("cache_key", None)
+        etag = flask.g.pop("etag", None)
+        payloads = flask.g.pop("cache_payloads", None)
+        # 204 is PreventUpdate, nothing to reuse
+        if response.status_code != 200 or response.is_streamed:
+            return response
+        if key is not None:
+            payloads = encode(response.get_data(), flask.current_app.config)
+            self.set(key, payloads)
+            self.finish()
+        if payloads is not None:
+            # send the stored encoding, Flask-Compress leaves encoded bodies alone
+            encoding = flask.request.accept_encodings.best_match(
+                [e for e in ENCODINGS if e in payloads]
+            )
+            response.vary.add("Accept-Encoding")
+            if encoding is not None:
+                response.set_data(payloads[encoding])
+                response.headers["Content-Encoding"] = encoding
+                etag = etag and etag + ":" + encoding
+        if etag is not None:
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    def finish(self, exc=None):
+        # wake the requests waiting on this one, also when it failed
+        key = flask.g.pop("flight_key", None)
+        if key is not None:
+            self.flights.finish(key)
@@ -0,0 +1,338 @@
+import hashlib
+import os
+import socket
+import struct
+import tempfile
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+
+import metrics
+
+#############################################################################
+# Storage for the response cache. Every backend maps a key to the payloads of
+# one response ({"identity": bytes, "br": bytes, "gzip": bytes}); get() returns
+# None on a miss and a backend that fails behaves as a miss, never as an error.
+# CACHE_URL picks one:
+#
+#     memory (default)        LRU in each worker
+#     disk:///var/cache/x     files shared by the workers of one host
+#     redis://host:6379/0     any Redis-protocol server, shared by all hosts
+#
+# Shared backends sit behind a small in-memory LRU, so hot keys cost no I/O.
+# They also provide a lock per key (acquire/release/locked) that expires on
+# its own, used to build each response once across processes.
+#############################################################################
+
+metrics.describe(
+    "cache_backend_errors_total", "Shared cache operations that failed (as misses)."
+)
+
+
+def pack(payloads):
+    # length-prefixed frames; shared stores get bytes, never pickles
+    parts = []
+    for name, data in payloads.items():
+        parts += [struct.pack("!BI", len(name), len(data)), name.encode(), data]
+    return b"".join(parts)
+
+
+def unpack(blob):
+    payloads, offset = {}, 0
+    while offset < len(blob):
+        name_length, data_length = struct.unpack_from("!BI", blob, offset)
+        offset += 5
+        name = blob[offset : offset + name_length].decode()
+        offset += name_length
+        payloads[name] = blob[offset : offset + data_length]
+        offset += data_length
+    return payloads
+
+
+class MemoryBackend:
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            payloads = self._entries.get(key)
+            if payloads is not None:
+                self._entries.move_to_end(key)
+            return payloads
+
+    def set(self, key, payloads):
+        with self._lock:
+            self._entries[key] = payloads
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def acquire(self, key, ttl):
+        # nothing shared: every process is on its own
+        return True
+
+    def release(self, key):
+        pass
+
+    def locked(self, key):
+        return False
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskBackend:
+    # one file per key, written atomically; the oldest files are removed
+    # once the directory holds more than max_entries
+    def __init__(self, directory, max_entries=10000, lock_ttl=30):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.lock_ttl = lock_ttl
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self.path(key), "rb") as f:
+                return unpack(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, struct.error):
+            metrics.increment("cache_backend_errors_total", backend="disk")
+            return None
+
+    def set(self, key, payloads):
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(pack(payloads))
+            os.replace(tmp, self.path(key))
+        except OSError:
+            metrics.increment("cache_backend_errors_total", backend="disk")
+            return
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self.prune()
+
+    def lock_path(self, key):
+        # dot files are skipped by prune() and len()
+        return os.path.join(
+            self.directory, "." + hashlib.sha1(key.encode()).hexdigest() + ".lock"
+        )
+
+    def acquire(self, key, ttl):
+        path = self.lock_path(key)
+        for _ in range(2):
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                if self.locked(key, ttl):
+                    return False
+                # left behind by a crashed process
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            except OSError:
+                metrics.increment("cache_backend_errors_total", backend="disk")
+                return True
+        return False
+
+    def release(self, key):
+        try:
+            os.remove(self.lock_path(key))
+        except FileNotFoundError:
+            pass
+
+    def locked(self, key, ttl=None):
+        try:
+            age = time.time() - os.stat(self.lock_path(key)).st_mtime
+            return age < (ttl or self.lock_ttl)
+        except FileNotFoundError:
+            return False
+
+    def prune(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.startswith("."):
+                    try:
+                        entries.append((entry.stat().st_mtime, entry.path))
+                    except FileNotFoundError:
+                        pass
+        entries.sort()
+        for _, path in entries[: max(0, len(entries) - self.max_entries)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def __len__(self):
+        return sum(1 for n in os.listdir(self.directory) if not n.startswith("."))
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisBackend:
+    # Minimal RESP client, one connection per thread. Entries expire after
+    # `ttl` seconds, so old data versions drop out on their own. After a
+    # connection failure the backend reports misses for `retry_after` seconds
+    # instead of paying a connect timeout on every request.
+    def __init__(self, url, ttl=86400, timeout=0.5, retry_after=5, prefix="covid19:"):
+        parsed = urllib.parse.urlsplit(url)
+        self.address = (parsed.hostname or "localhost", parsed.port or 6379)
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.ttl = ttl
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.prefix = prefix
+        self._local = threading.local()
+        self._down_until = 0
+        # a worker forked after the master used the backend (cache warm-up)
+        # must not share its socket
+        os.register_at_fork(after_in_child=self._forget_connections)
+
+    def _forget_connections(self):
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            sock = socket.create_connection(self.address, timeout=self.timeout)
+            conn = self._local.conn = (sock, sock.makefile("rb"))
+            if self.password:
+                self._call(conn, "AUTH", self.password)
+            if self.db:
+                self._call(conn, "SELECT", self.db)
+        return conn
+
+    def _call(self, conn, *args):
+        sock, reader = conn
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts += [b"$%d\r\n" % len(arg), arg, b"\r\n"]
+        sock.sendall(b"".join(parts))
+        return self._reply(reader)
+
+    def _reply(self, reader):
+        line = reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RedisError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("connection closed")
+            return data[:-2]
+        if kind == b"*":
+            count = int(rest)
+            return None if count < 0 else [self._reply(reader) for _ in range(count)]
+        raise RedisError(f"unexpected reply {line!r}")
+
+    def command(self, *args):
+        # None when the server is unreachable or answered with an error
+        if time.monotonic() < self._down_until:
+            return None
+        try:
+            return self._call(self._connection(), *args)
+        except (OSError, RedisError) as exc:
+            conn = getattr(self._local, "conn", None)
+            self._local.conn = None
+            if conn is not None:
+                conn[0].close()
+            if not isinstance(exc, RedisError):
+                self._down_until = time.monotonic() + self.retry_after
+            metrics.increment("cache_backend_errors_total", backend="redis")
+            return None
+
+    def get(self, key):
+        blob = self.command("GET", self.prefix + key)
+        if blob is None:
+            return None
+        try:
+            return unpack(blob)
+        except (ValueError, struct.error):
+            return None
+
+    def set(self, key, payloads):
+        self.command("SET", self.prefix + key, pack(payloads), "EX", self.ttl)
+
+    def acquire(self, key, ttl):
+        lock = self.prefix + "lock:" + key
+        return (
+            self.command("SET", lock, os.getpid(), "NX", "PX", int(ttl * 1000)) == "OK"
+        )
+
+    def release(self, key):
+        self.command("DEL", self.prefix + "lock:" + key)
+
+    def locked(self, key):
+        return self.command("GET", self.prefix + "lock:" + key) is not None
+
+    def __len__(self):
+        return self.command("DBSIZE") or 0
+
+
+class TieredBackend:
+    # in-process LRU in front of a shared backend
+    def __init__(self, local, shared):
+        self.local = local
+        self.shared = shared
+
+    def get(self, key):
+        payloads = self.local.get(key)
+        if payloads is None:
+            payloads = self.shared.get(key)
+            if payloads is not None:
+                self.local.set(key, payloads)
+        return payloads
+
+    def set(self, key, payloads):
+        self.local.set(key, payloads)
+        self.shared.set(key, payloads)
+
+    def acquire(self, key, ttl):
+        return self.shared.acquire(key, ttl)
+
+    def release(self, key):
+        self.shared.release(key)
+
+    def locked(self, key):
+        return self.shared.locked(key)
+
+    def __len__(self):
+        return len(self.shared)
+
+
+def from_url(url, max_entries=512):
+    if not url or url == "memory":
+        return MemoryBackend(max_entries)
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme == "disk":
+        shared = DiskBackend(parsed.path)
+    elif parsed.scheme == "redis":
+        shared = RedisBackend(url)
+    else:
+        raise ValueError(f"unknown cache backend {url!r}")
+    return TieredBackend(MemoryBackend(max_entries), shared)
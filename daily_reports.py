@@ -0,0 +1,265 @@
+import argparse
+import json
+import os
+import re
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+#############################################################################
+# Store of the JHU daily reports (csse_covid_19_daily_reports/MM-DD-YYYY.csv):
+#
+#     python daily_reports.py SOURCE_DIR STORE_DIR [--workers 8]
+#
+# parses the reports in a process pool, renames the columns of every schema the
+# files went through to one set (REPORT_SCHEMA), and compacts them into one
+# parquet file per month, STORE_DIR/month=YYYY-MM/part.parquet, sorted by date
+# and location. STORE_DIR/_manifest.json lists the reports already stored with
+# their size and mtime, so a re-run parses only new or changed reports and
+# rewrites only their months. read_store() queries the store by date range,
+# country and columns, reading only the months in range. Needs pyarrow
+# (pinned in requirements.txt).
+#############################################################################
+
+REPORT_NAME = re.compile(r"(\d\d)-(\d\d)-(\d{4})\.csv$")
+MANIFEST = "_manifest.json"
+PARTITION_FILE = "part.parquet"
+SORT_KEYS = ["Date", "Country/Region", "Province/State", "Admin2"]
+
+# column names used by the reports over time, by the name stored
+COLUMN_NAMES = {
+    "FIPS": ["FIPS"],
+    "Admin2": ["Admin2"],
+    "Province/State": ["Province/State", "Province_State"],
+    "Country/Region": ["Country/Region", "Country_Region"],
+    "Last_Update": ["Last Update", "Last_Update"],
+    "Lat": ["Latitude", "Lat"],
+    "Long": ["Longitude", "Long_"],
+    "Confirmed": ["Confirmed"],
+    "Deaths": ["Deaths"],
+    "Recovered": ["Recovered"],
+    "Active": ["Active"],
+    "Incident_Rate": ["Incidence_Rate", "Incident_Rate"],
+    "Case_Fatality_Ratio": ["Case-Fatality_Ratio", "Case_Fatality_Ratio"],
+}
+COUNT_COLUMNS = ["Confirmed", "Deaths", "Recovered", "Active"]
+FLOAT_COLUMNS = ["Lat", "Long", "Incident_Rate", "Case_Fatality_Ratio"]
+
+# country names of the early reports, as the time series spell them
+COUNTRY_NAMES = {
+    "Mainland China": "China",
+    "South Korea": "Korea, South",
+    "Republic of Korea": "Korea, South",
+    "Iran (Islamic Republic of)": "Iran",
+    "Taiwan": "Taiwan*",
+    "UK": "United Kingdom",
+    "Viet Nam": "Vietnam",
+    "Russian Federation": "Russia",
+    "Czech Republic": "Czechia",
+    "Republic of Moldova": "Moldova",
+    "Republic of Ireland": "Ireland",
+    "Bahamas, The": "Bahamas",
+    "The Bahamas": "Bahamas",
+    "Gambia, The": "Gambia",
+    "The Gambia": "Gambia",
+    "Ivory Coast": "Cote d'Ivoire",
+    "Cape Verde": "Cabo Verde",
+    "East Timor": "Timor-Leste",
+    "Vatican City": "Holy See",
+    "occupied Palestinian territory": "West Bank and Gaza",
+}
+
+REPORT_SCHEMA = pa.schema(
+    [
+        ("Date", pa.date32()),
+        ("FIPS", pa.int64()),
+        ("Admin2", pa.string()),
+        ("Province/State", pa.string()),
+        ("Country/Region", pa.string()),
+        ("Last_Update", pa.timestamp("s")),
+        ("Lat", pa.float64()),
+        ("Long", pa.float64()),
+        ("Confirmed", pa.int64()),
+        ("Deaths", pa.int64()),
+        ("Recovered", pa.int64()),
+        ("Active", pa.int64()),
+        ("Incident_Rate", pa.float64()),
+        ("Case_Fatality_Ratio", pa.float64()),
+    ]
+)
+
+
+def report_date(name):
+    month, day, year = REPORT_NAME.search(name).groups()
+    return pd.Timestamp(int(year), int(month), int(day))
+
+
+def read_report(path):
+    # one report in REPORT_SCHEMA's columns, whichever schema it was written in
+    raw = pd.read_csv(path, dtype=str, encoding="utf-8-sig")
+    raw.columns = raw.columns.str.strip()
+    df = pd.DataFrame(index=raw.index)
+    for name, aliases in COLUMN_NAMES.items():
+        found = [alias for alias in aliases if alias in raw.columns]
+        df[name] = raw[found[0]] if found else None
+    for name in ("Admin2", "Province/State", "Country/Region"):
+        # names were written with stray spaces at times; numbers parse regardless
+        df[name] = df[name].str.strip()
+        df[name] = df[name].mask(df[name] == "")
+    df["Country/Region"] = df["Country/Region"].replace(COUNTRY_NAMES)
+    for name in COUNT_COLUMNS + ["FIPS"]:
+        # blank counts stay missing, FIPS codes are written as "1001.0" at times
+        df[name] = pd.to_numeric(df[name], errors="coerce").round().astype("Int64")
+    for name in FLOAT_COLUMNS:
+        df[name] = pd.to_numeric(df[name], errors="coerce")
+    df["Last_Update"] = pd.to_datetime(
+        df["Last_Update"], format="mixed", errors="coerce"
+    ).dt.floor("s")
+    df.insert(0, "Date", report_date(path).date())
+    return pa.Table.from_pandas(df, schema=REPORT_SCHEMA, preserve_index=False)
+
+
+def partition_path(store, month):
+    return os.path.join(store, f"month={month}", PARTITION_FILE)
+
+
+def write_atomic(path, write):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def compact_month(store, month, paths):
+    # Runs in a worker process: parses the reports of one month and rewrites
+    # its partition with them, replacing the days they cover. Returns the row
+    # count of every report.
+    reports = {os.path.basename(path): read_report(path) for path in paths}
+    tables = list(reports.values())
+    path = partition_path(store, month)
+    if os.path.exists(path):
+        stored = pq.read_table(path, schema=REPORT_SCHEMA)
+        dates = pa.array(
+            [report_date(name).date() for name in reports], type=pa.date32()
+        )
+        tables.append(stored.filter(pc.invert(pc.is_in(stored["Date"], dates))))
+    table = pa.concat_tables(tables).sort_by(
+        [(name, "ascending") for name in SORT_KEYS]
+    )
+    write_atomic(
+        path,
+        lambda f: pq.write_table(table, f, compression="zstd", row_group_size=1 << 17),
+    )
+    return {name: report.num_rows for name, report in reports.items()}
+
+
+def load_manifest(store):
+    try:
+        with open(os.path.join(store, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def pending_reports(source, manifest):
+    # reports that are new or changed since they were stored, by month
+    months = defaultdict(list)
+    for name in sorted(os.listdir(source)):
+        if not REPORT_NAME.search(name):
+            continue
+        stat = os.stat(os.path.join(source, name))
+        stored = manifest.get(name)
+        if stored and (stored["size"], stored["mtime_ns"]) == (
+            stat.st_size,
+            stat.st_mtime_ns,
+        ):
+            continue
+        months[report_date(name).strftime("%Y-%m")].append(os.path.join(source, name))
+    return months
+
+
+def ingest(source, store, workers=None, force=False):
+    started = time.perf_counter()
+    manifest = {} if force else load_manifest(store)
+    months = pending_reports(source, manifest)
+    with ProcessPoolExecutor(workers) as executor:
+        # the largest months first, so no worker is left with a long tail
+        order = sorted(months, key=lambda month: -len(months[month]))
+        futures = {
+            month: executor.submit(compact_month, store, month, months[month])
+            for month in order
+        }
+        rows = {}
+        for month in order:
+            rows.update(futures[month].result())
+    for name, count in rows.items():
+        stat = os.stat(os.path.join(source, name))
+        manifest[name] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "rows": count,
+        }
+    # the manifest is written last: an interrupted run parses its reports again
+    write_atomic(
+        os.path.join(store, MANIFEST),
+        lambda f: f.write(json.dumps(manifest, indent=1, sort_keys=True).encode()),
+    )
+    return {
+        "reports": len(rows),
+        "rows": sum(rows.values()),
+        "months": sorted(months),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def read_store(store, start=None, end=None, countries=None, columns=None):
+    # Rows from `start` to `end` (dates, inclusive) of the `countries` given,
+    # as a DataFrame; only the partitions of the months in range are read
+    dataset = ds.dataset(store, format="parquet", partitioning="hive")
+    conditions = []
+    if start is not None:
+        start = pd.Timestamp(start)
+        conditions += [
+            ds.field("month") >= start.strftime("%Y-%m"),
+            ds.field("Date") >= pa.scalar(start.date(), pa.date32()),
+        ]
+    if end is not None:
+        end = pd.Timestamp(end)
+        conditions += [
+            ds.field("month") <= end.strftime("%Y-%m"),
+            ds.field("Date") <= pa.scalar(end.date(), pa.date32()),
+        ]
+    if countries is not None:
+        conditions.append(ds.field("Country/Region").isin(list(countries)))
+    condition = None
+    for c in conditions:
+        condition = c if condition is None else condition & c
+    table = dataset.to_table(columns=columns or REPORT_SCHEMA.names, filter=condition)
+    return table.to_pandas()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("source_dir", help="directory of MM-DD-YYYY.csv reports")
+    parser.add_argument("store_dir")
+    parser.add_argument("--workers", type=int, help="processes (default: CPUs)")
+    parser.add_argument("--force", action="store_true", help="parse every report")
+    args = parser.parse_args()
+    print(json.dumps(ingest(args.source_dir, args.store_dir, args.workers, args.force)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import gzip
+import http.client
+import io
+import os
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+#############################################################################
+# Parallel download of the data sources. read_all() fetches every source at
+# once on a thread pool, over keep-alive HTTP/1.1 connections pooled per host,
+# and hands each response to `parse` as a stream (gzip-decoded on the fly), so
+# pandas parses a file while the rest of it is still arriving and the cold
+# start costs about as much as the slowest download. An attempt that fails
+# (connection error, timeout, 429/5xx, body cut short) is retried from the
+# start with exponential backoff. Sources that are not http(s) URLs are
+# local paths, parsed straight from disk. FETCH_TIMEOUT bounds each connect
+# and read, in seconds.
+#############################################################################
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+metrics.describe("source_fetch_seconds", "Download and parse time of each source.")
+metrics.describe("source_fetch_retries_total", "Source downloads that were retried.")
+
+
+class FetchError(Exception):
+    pass
+
+
+class ConnectionPool:
+    # idle keep-alive connections by (scheme, host, port)
+    def __init__(self, timeout=30, max_idle=4):
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def get(self, scheme, host, port):
+        with self._lock:
+            idle = self._idle.get((scheme, host, port))
+            if idle:
+                return idle.pop()
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def put(self, scheme, host, port, conn):
+        with self._lock:
+            idle = self._idle.setdefault((scheme, host, port), [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+
+class Tee(io.RawIOBase):
+    # Readable view of `stream` keeping a copy of every byte read, so a parser
+    # can consume the body as it arrives and the raw bytes remain available
+    def __init__(self, stream):
+        self.stream = stream
+        self.copy = io.BytesIO()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.stream.read(len(buffer))
+        buffer[: len(data)] = data
+        self.copy.write(data)
+        return len(data)
+
+    def getvalue(self):
+        # the whole body, including whatever the parser left unread
+        while self.read(1 << 20):
+            pass
+        return self.copy.getvalue()
+
+
+pool = ConnectionPool(timeout=float(os.environ.get("FETCH_TIMEOUT", "30")))
+
+
+def fetch(url, parse, retries=3, backoff=0.5, connections=pool):
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme not in ("http", "https"):
+        with open(url, "rb") as f:
+            return parse(f)
+    host = (parsed.scheme, parsed.hostname, parsed.port)
+    path = parsed.path + ("?" + parsed.query if parsed.query else "")
+    for attempt in range(retries + 1):
+        conn = connections.get(*host)
+        try:
+            conn.request("GET", path, headers={"Accept-Encoding": "gzip"})
+            response = conn.getresponse()
+            if response.status in RETRY_STATUSES:
+                response.read()
+                raise http.client.HTTPException(f"HTTP {response.status}")
+            if response.status != 200:
+                conn.close()
+                raise FetchError(f"{url}: HTTP {response.status}")
+            stream = response
+            if response.getheader("Content-Encoding") == "gzip":
+                stream = gzip.GzipFile(fileobj=response)
+            result = parse(stream)
+            # the parser may stop early; the connection is only reusable once
+            # the whole body has been read
+            if response.read() or response.will_close:
+                conn.close()
+            else:
+                connections.put(*host, conn)
+            return result
+        except (OSError, EOFError, http.client.HTTPException) as exc:
+            conn.close()
+            if attempt == retries:
+                raise FetchError(f"{url}: {exc!r}") from exc
+            metrics.increment("source_fetch_retries_total")
+            time.sleep(backoff * 2**attempt)
+
+
+def read_all(urls, parse, retries=3, backoff=0.5, connections=pool):
+    # parse(stream) of every url, in order, all downloaded at once; `parse`
+    # may also be a list with one parser per url
+    parsers = parse if isinstance(parse, list) else [parse] * len(urls)
+
+    def timed(url, parse):
+        started = time.perf_counter()
+        result = fetch(url, parse, retries, backoff, connections)
+        metrics.observe(
+            "source_fetch_seconds",
+            time.perf_counter() - started,
+            source=url.rsplit("/", 1)[-1],
+        )
+        return result
+
+    with ThreadPoolExecutor(len(urls), thread_name_prefix="fetch") as executor:
+        return list(executor.map(timed, urls, parsers))
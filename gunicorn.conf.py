@@ -0,0 +1,48 @@
+import gc
+import multiprocessing
+import os
+
+#############################################################################
+# Preload-and-fork startup: the CSVs are fetched and preprocessed once, at
+# import of app.py in the master, and workers fork with copy-on-write pages.
+#############################################################################
+preload_app = os.environ.get("PRELOAD_APP", "1") != "0"
+
+bind = "0.0.0.0:" + os.environ.get("PORT", "8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+timeout = 120
+# GUNICORN_THREADS > 1 runs gthread workers, each serving that many requests at
+# once: the figure builders only read the shared dataset (benchmarks/concurrency.py)
+threads = int(os.environ.get("GUNICORN_THREADS", "1"))
+# Build the default views and the most requested locations before serving
+# (warmup.py): once in the master when preloading, which the workers inherit
+# with its memory cache, otherwise in each worker
+warmup = os.environ.get("WARMUP", "1") != "0"
+
+
+def when_ready(server):
+    if preload_app:
+        import app
+
+        # threads do not survive the fork: the workers inherit the full
+        # history (and the warmed cache) from the master
+        if warmup:
+            app.warm_cache(background=False)
+        else:
+            app.wait_for_history()
+    # Move everything built during preload into the permanent generation, so
+    # the cyclic GC in the workers never writes to (and copies) those pages.
+    if preload_app:
+        # app.py defers plotly.express to the first top-10 graph; with a
+        # preloaded master it costs nothing to import it once here for all workers
+        import plotly.express  # noqa: F401
+
+        gc.collect()
+        gc.freeze()
+
+
+def post_worker_init(worker):
+    if warmup and not preload_app:
+        import app
+
+        app.warm_cache()
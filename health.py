@@ -0,0 +1,27 @@
+import flask
+
+#############################################################################
+# Probes for the load balancer. /healthz answers 200 whenever the process
+# serves requests (liveness); /readyz answers 503 until status()["ready"] is
+# true, so a rollout sends no users to a worker still loading the data or
+# warming its cache. Both return the status as JSON and are never cached.
+#############################################################################
+
+
+def install(server, status):
+    # status: callable returning a JSON-able dict with a boolean "ready"
+    def probe(require_ready):
+        body = status()
+        response = flask.jsonify(body)
+        if require_ready and not body["ready"]:
+            response.status_code = 503
+        response.headers["Cache-Control"] = "no-store"
+        return response
+
+    @server.route("/healthz")
+    def healthz():
+        return probe(False)
+
+    @server.route("/readyz")
+    def readyz():
+        return probe(True)
@@ -0,0 +1,206 @@
+import functools
+import threading
+import time
+
+import flask
+
+#############################################################################
+# Per-callback latency and payload metrics, exposed on /metrics in the
+# Prometheus text format. Every number is recorded with a couple of
+# perf_counter() calls and one locked dict update, cheap enough to leave on.
+# Metrics are per process: with several gunicorn workers each one reports its own.
+#############################################################################
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BYTES_BUCKETS = (1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7)
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_help = {}
+
+DASH_UPDATE_PATH = "/_dash-update-component"
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.sum += value
+
+
+def describe(name, text):
+    _help[name] = text
+
+
+def observe(name, value, buckets=SECONDS_BUCKETS, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+
+def increment(name, amount=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def _labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+def render():
+    lines = []
+    with _lock:
+        histograms = sorted(
+            (k, list(h.counts), h.sum, h.buckets) for k, h in _histograms.items()
+        )
+        counters = sorted(_counters.items())
+    typed = set()
+    for (name, labels), counts, total, buckets in histograms:
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# HELP {name} {_help.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, count in zip(list(buckets) + ["+Inf"], counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(labels, le=bound)} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {total}")
+        lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+    for (name, labels), value in counters:
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# HELP {name} {_help.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+describe("dash_callback_duration_seconds", "Wall time of a callback request.")
+describe("dash_callback_build_seconds", "Time spent in the callback building figures.")
+describe(
+    "dash_callback_serialize_seconds",
+    "Time from the callback returning to Dash's response being ready (JSON"
+    " encoding), before the cache stores or compresses it.",
+)
+describe("dash_callback_request_bytes", "Size of the callback request body.")
+describe("dash_callback_response_bytes", "Size of the callback response body.")
+describe(
+    "dash_callback_cache_total",
+    "Callback responses by cache result: hit, miss, coalesced (waited for an"
+    " identical request in flight) or stale (previous data version, rebuilding).",
+)
+
+
+def timed_callback(func):
+    # innermost decorator of a Dash callback: times the figure building only,
+    # Dash serializes the returned figures after this returns. Called outside
+    # a request (benchmarks, warm-up helpers) it just runs the callback.
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not flask.has_request_context():
+            return func(*args, **kwargs)
+        flask.g.callback_name = func.__name__
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            flask.g.build_done = time.perf_counter()
+            flask.g.build_seconds = flask.g.build_done - started
+
+    return wrapper
+
+
+def instrument(app):
+    # Call after every callback is registered, and before anything else that
+    # hooks before_request (the response cache), so the timer starts first
+    server = app.server
+    # clientside callbacks run in the browser and never reach the server
+    names = {
+        output: cb["callback"].__name__
+        for output, cb in app.callback_map.items()
+        if "callback" in cb
+    }
+
+    # the serialization time ends when Dash's view returns, ahead of the
+    # after_request hooks (the response cache encodes misses there)
+    endpoint = next(
+        rule.endpoint
+        for rule in server.url_map.iter_rules()
+        if rule.rule.endswith(DASH_UPDATE_PATH)
+    )
+    view = server.view_functions[endpoint]
+
+    @functools.wraps(view)
+    def timed_view(*args, **kwargs):
+        try:
+            return view(*args, **kwargs)
+        finally:
+            flask.g.response_ready = time.perf_counter()
+
+    server.view_functions[endpoint] = timed_view
+
+    @server.before_request
+    def start_timer():
+        if flask.request.path.endswith(DASH_UPDATE_PATH):
+            flask.g.request_started = time.perf_counter()
+
+    @server.after_request
+    def record(response):
+        started = flask.g.get("request_started")
+        if started is None:
+            return response
+        now = time.perf_counter()
+        body = flask.request.get_json(silent=True) or {}
+        callback = flask.g.get("callback_name") or names.get(
+            body.get("output"), "unknown"
+        )
+        observe("dash_callback_duration_seconds", now - started, callback=callback)
+        if flask.g.get("build_done") is not None:
+            observe(
+                "dash_callback_build_seconds", flask.g.build_seconds, callback=callback
+            )
+            observe(
+                "dash_callback_serialize_seconds",
+                flask.g.get("response_ready", now) - flask.g.build_done,
+                callback=callback,
+            )
+        observe(
+            "dash_callback_request_bytes",
+            flask.request.content_length or 0,
+            BYTES_BUCKETS,
+            callback=callback,
+        )
+        if not response.is_streamed:
+            observe(
+                "dash_callback_response_bytes",
+                response.calculate_content_length() or 0,
+                BYTES_BUCKETS,
+                callback=callback,
+            )
+        cache_status = flask.g.get("cache_status")
+        if cache_status:
+            increment(
+                "dash_callback_cache_total", callback=callback, result=cache_status
+            )
+        return response
+
+    @server.route("/metrics")
+    def prometheus_metrics():
+        return flask.Response(render(), mimetype="text/plain; version=0.0.4")
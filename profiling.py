@@ -0,0 +1,194 @@
+import collections
+import itertools
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+
+import flask
+
+#############################################################################
+# Opt-in per-request profiling for debugging one slow interaction.
+# With PROFILING_ENABLED=1, a callback request carrying an "X-Profile: 1" header,
+# a "profile=1" query flag or a "profile=1" cookie runs under a sampling
+# profiler. The collapsed stacks (flamegraph.pl / speedscope input) are written
+# to PROFILE_DIR, shared by all gunicorn workers, and served by /admin/profiles.
+# Set PROFILE_TOKEN to require it in an X-Admin-Token header or token= query,
+# both to profile a request and to read the profiles. Only the newest
+# PROFILE_MAX_FILES (default 200) profiles are kept.
+#############################################################################
+
+DASH_UPDATE_PATH = "/_dash-update-component"
+PROFILE_NAME = re.compile(r"^[\w.-]+\.folded$")
+
+
+class Sampler(threading.Thread):
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                filename = os.path.basename(code.co_filename)
+                stack.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return self.stacks
+
+
+def folded(stacks):
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def speedscope(text, name, interval):
+    # speedscope "sampled" profile built from collapsed stacks
+    frames, index, samples, weights = [], {}, [], []
+    for line in text.splitlines():
+        stack, _, count = line.rpartition(" ")
+        sample = []
+        for frame in stack.split(";"):
+            if frame not in index:
+                index[frame] = len(frames)
+                frames.append({"name": frame})
+            sample.append(index[frame])
+        samples.append(sample)
+        weights.append(int(count) * interval)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": [
+            {
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }
+        ],
+    }
+
+
+def install(server):
+    # Register before the response cache so a profiled request bypasses it
+    if os.environ.get("PROFILING_ENABLED", "0") != "1":
+        return
+    profile_dir = os.environ.get("PROFILE_DIR") or os.path.join(
+        tempfile.gettempdir(), "covid19-profiles"
+    )
+    os.makedirs(profile_dir, exist_ok=True)
+    interval = float(os.environ.get("PROFILE_INTERVAL", "0.001"))
+    token = os.environ.get("PROFILE_TOKEN")
+    max_files = int(os.environ.get("PROFILE_MAX_FILES", "200"))
+    # distinguishes profiles of one callback started in the same second
+    sequence = itertools.count()
+
+    def requested():
+        request = flask.request
+        return "1" in (
+            request.headers.get("X-Profile"),
+            request.args.get("profile"),
+            request.cookies.get("profile"),
+        )
+
+    def authorized():
+        request = flask.request
+        supplied = request.headers.get("X-Admin-Token") or request.args.get("token")
+        return token is None or supplied == token
+
+    def prune():
+        # drop the oldest profiles beyond max_files, another worker may be
+        # pruning at the same time
+        paths = [
+            os.path.join(profile_dir, n)
+            for n in os.listdir(profile_dir)
+            if PROFILE_NAME.match(n)
+        ]
+        if len(paths) <= max_files:
+            return
+        by_age = []
+        for path in paths:
+            try:
+                by_age.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+        for _, path in sorted(by_age)[: len(by_age) - max_files]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @server.before_request
+    def start_profile():
+        # unauthorized requests are served normally, from the cache
+        if (
+            flask.request.path.endswith(DASH_UPDATE_PATH)
+            and requested()
+            and authorized()
+        ):
+            flask.g.cache_bypass = True
+            flask.g.profile_started = time.time()
+            flask.g.sampler = Sampler(threading.get_ident(), interval)
+            flask.g.sampler.start()
+
+    @server.after_request
+    def save_profile(response):
+        sampler = flask.g.pop("sampler", None)
+        if sampler is None:
+            return response
+        stacks = sampler.stop()
+        callback = flask.g.get("callback_name", "callback")
+        name = "{}-{}-{}-{}.folded".format(
+            time.strftime("%Y%m%dT%H%M%S", time.gmtime(flask.g.profile_started)),
+            callback,
+            os.getpid(),
+            next(sequence),
+        )
+        with open(os.path.join(profile_dir, name), "w") as f:
+            f.write(folded(stacks))
+        prune()
+        response.headers["X-Profile-Id"] = name
+        return response
+
+    @server.route("/admin/profiles")
+    def list_profiles():
+        if not authorized():
+            flask.abort(403)
+        names = sorted(
+            (n for n in os.listdir(profile_dir) if PROFILE_NAME.match(n)), reverse=True
+        )
+        return flask.jsonify(names)
+
+    @server.route("/admin/profiles/<name>")
+    def get_profile(name):
+        if not authorized():
+            flask.abort(403)
+        if not PROFILE_NAME.match(name):
+            flask.abort(404)
+        path = os.path.join(profile_dir, name)
+        if not os.path.exists(path):
+            flask.abort(404)
+        with open(path) as f:
+            text = f.read()
+        if flask.request.args.get("format") == "speedscope":
+            return flask.Response(
+                json.dumps(speedscope(text, name, interval)),
+                mimetype="application/json",
+            )
+        return flask.Response(text, mimetype="text/plain")
@@ -0,0 +1,214 @@
+import argparse
+import html as escape
+import json
+import os
+import re
+import shutil
+
+import plotly
+from plotly.offline import get_plotlyjs
+
+import app
+import warmup
+
+#############################################################################
+# Static snapshot of the landing view, one directory per data version:
+#
+#     python snapshot.py OUT_DIR [--app-url https://dashboard.example.com/]
+#
+# writes OUT_DIR/<data version>/ with index.html (the whole page with every
+# figure in its default state, the KPI and leaderboard blocks as plain HTML),
+# layout.json and figures.json, plus OUT_DIR/plotly.min.js and the app's
+# assets/*.css (content-hashed, see static_assets.py) shared by all versions,
+# and OUT_DIR/latest.json and OUT_DIR/index.html pointing at the newest.
+# The files can be served from disk or a CDN; the Dash app is only needed for
+# interactive drill-down.
+#############################################################################
+
+UNITLESS_STYLES = {"fontWeight", "lineHeight", "opacity", "zIndex", "flex", "order"}
+HTML_ATTRIBUTES = {"id", "href", "src", "title", "target", "alt", "colSpan"}
+TABLE_ROWS = 100
+
+
+def default_outputs(dash_app):
+    # Run every callback fired on page load with the layout's initial values,
+    # through the Dash endpoint so the JSON is exactly what the browser gets
+    client = dash_app.server.test_client()
+    dependencies = client.get("/_dash-dependencies").get_json()
+    outputs = {}
+    for body in warmup.initial_requests(dash_app, dependencies):
+        response = client.post("/_dash-update-component", json=body)
+        if response.status_code != 200:
+            continue
+        for component_id, props in response.get_json()["response"].items():
+            for prop, value in props.items():
+                outputs[f"{component_id}.{prop}"] = value
+    return outputs
+
+
+def css(style):
+    declarations = []
+    for name, value in (style or {}).items():
+        if isinstance(value, (int, float)) and name not in UNITLESS_STYLES:
+            value = f"{value}px"
+        name = re.sub("([A-Z])", lambda m: "-" + m.group(1).lower(), name)
+        declarations.append(f"{name}:{value}")
+    return ";".join(declarations)
+
+
+def attributes(component):
+    attrs = []
+    for name in HTML_ATTRIBUTES:
+        value = getattr(component, name, None)
+        if value is not None:
+            attrs.append(f'{name.lower()}="{escape.escape(str(value))}"')
+    if getattr(component, "className", None):
+        attrs.append(f'class="{escape.escape(component.className)}"')
+    if getattr(component, "style", None):
+        attrs.append(f'style="{escape.escape(css(component.style))}"')
+    return "".join(" " + a for a in attrs)
+
+
+def script_json(value):
+    # JSON inside <script>, "</" would end the element
+    return json.dumps(value, cls=plotly.utils.PlotlyJSONEncoder).replace("</", "<\\/")
+
+
+def render(component, outputs):
+    if component is None:
+        return ""
+    if isinstance(component, (list, tuple)):
+        return "".join(render(c, outputs) for c in component)
+    if not hasattr(component, "_type"):
+        return escape.escape(str(component))
+    kind = component._type
+    component_id = getattr(component, "id", None)
+    if component._namespace == "dash_html_components":
+        tag = kind.lower()
+        if tag in ("br", "hr", "img"):
+            return f"<{tag}{attributes(component)}>"
+        children = render(getattr(component, "children", None), outputs)
+        return f"<{tag}{attributes(component)}>{children}</{tag}>"
+    if kind == "Graph":
+        figure = outputs.get(f"{component_id}.figure") or getattr(
+            component, "figure", None
+        )
+        if not figure:
+            return f'<div id="{component_id}"></div>'
+        return (
+            f'<div id="{component_id}"></div><script>Plotly.newPlot('
+            f'"{component_id}", {script_json(figure.get("data", []))}, '
+            f'{script_json(figure.get("layout", {}))}, {{"responsive": true}});'
+            "</script>"
+        )
+    if kind in ("RadioItems", "Dropdown"):
+        value = getattr(component, "value", None)
+        label_style = escape.escape(css(getattr(component, "labelStyle", None)))
+        labels = "".join(
+            f'<label style="{label_style}"><input type="radio" disabled'
+            f'{" checked" if o["value"] == value else ""}>'
+            f'{escape.escape(str(o["label"]))}</label>'
+            for o in component.options
+        )
+        style = escape.escape(css(getattr(component, "style", None)))
+        return f'<div style="{style}">{labels}</div>'
+    if kind == "DataTable":
+        columns = outputs.get(f"{component_id}.columns") or component.columns
+        rows = (outputs.get(f"{component_id}.data") or component.data)[:TABLE_ROWS]
+        head = "".join(f"<th>{escape.escape(str(c['name']))}</th>" for c in columns)
+        body = "".join(
+            "<tr>"
+            + "".join(
+                f"<td>{escape.escape(str(row.get(c['id'], '')))}</td>" for c in columns
+            )
+            + "</tr>"
+            for row in rows
+        )
+        return f"<table><thead><tr>{head}</tr></thead><tbody>{body}</tbody></table>"
+    # Store and anything else without a static rendering
+    return ""
+
+
+def stylesheet_assets(dash_app):
+    # the assets/*.css Dash links into every page, in the order it links them
+    folder = dash_app.config.assets_folder
+    if not os.path.isdir(folder):
+        return []
+    return sorted(name for name in os.listdir(folder) if name.endswith(".css"))
+
+
+def copy_assets(dash_app, out_dir):
+    target = os.path.join(out_dir, "assets")
+    os.makedirs(target, exist_ok=True)
+    for name in stylesheet_assets(dash_app):
+        if not os.path.exists(os.path.join(target, name)):
+            shutil.copyfile(
+                os.path.join(dash_app.config.assets_folder, name),
+                os.path.join(target, name),
+            )
+
+
+def page(dash_app, outputs, app_url):
+    hrefs = list(dash_app.config.external_stylesheets) + [
+        "../assets/" + name for name in stylesheet_assets(dash_app)
+    ]
+    stylesheets = "".join(
+        f'<link rel="stylesheet" href="{escape.escape(href)}">' for href in hrefs
+    )
+    banner = ""
+    if app_url:
+        banner = (
+            '<p style="text-align:center"><a href="{}">'
+            "Open the interactive dashboard</a></p>".format(escape.escape(app_url))
+        )
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8">'
+        f"<title>{escape.escape(dash_app.title)}</title>{stylesheets}"
+        '<script src="../plotly.min.js"></script></head>'
+        f"<body>{banner}{render(dash_app.layout, outputs)}</body></html>"
+    )
+
+
+def export(out_dir, app_url=None, force=False):
+    version_dir = os.path.join(out_dir, app.data_version)
+    if force or not os.path.exists(os.path.join(version_dir, "index.html")):
+        os.makedirs(version_dir, exist_ok=True)
+        plotly_js = os.path.join(out_dir, "plotly.min.js")
+        if not os.path.exists(plotly_js):
+            with open(plotly_js, "w") as f:
+                f.write(get_plotlyjs())
+        copy_assets(app.app, out_dir)
+        outputs = default_outputs(app.app)
+        with open(os.path.join(version_dir, "figures.json"), "w") as f:
+            json.dump(outputs, f, cls=plotly.utils.PlotlyJSONEncoder)
+        with open(os.path.join(version_dir, "layout.json"), "w") as f:
+            json.dump(app.app.layout, f, cls=plotly.utils.PlotlyJSONEncoder)
+        # index.html last: its presence marks a complete version
+        with open(os.path.join(version_dir, "index.html"), "w") as f:
+            f.write(page(app.app, outputs, app_url))
+    latest = {
+        "data_version": app.data_version,
+        "latest_date": app.df_confirmed.columns[-1],
+        "path": app.data_version + "/index.html",
+    }
+    with open(os.path.join(out_dir, "latest.json"), "w") as f:
+        json.dump(latest, f)
+    with open(os.path.join(version_dir, "index.html")) as f:
+        # the same page one level up: plotly.min.js and assets/ are siblings
+        index = f.read().replace('src="../', 'src="').replace('href="../', 'href="')
+    with open(os.path.join(out_dir, "index.html"), "w") as f:
+        f.write(index)
+    return version_dir
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("out_dir")
+    parser.add_argument("--app-url", help="link to the interactive dashboard")
+    parser.add_argument("--force", action="store_true", help="rewrite this version")
+    args = parser.parse_args()
+    print(export(args.out_dir, args.app_url, args.force))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import hashlib
+import os
+import re
+import sys
+
+import flask
+
+#############################################################################
+# Content-hashed assets. Dash serves every file in assets/ and links each
+# .css/.js automatically; a file named <name>.<8 hex of its sha1>.<ext> never
+# changes under the same URL, so it is sent with a one-year immutable
+# Cache-Control. After editing an asset, run
+#
+#     python static_assets.py
+#
+# to rename it to its new hash (files without a hash get one too).
+#############################################################################
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+HASHED_NAME = re.compile(r"^(?P<stem>.+)\.(?P<hash>[0-9a-f]{8})\.(?P<ext>css|js)$")
+ONE_YEAR = 31536000
+
+
+def content_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()[:8]
+
+
+def fingerprint(directory=ASSETS_DIR):
+    renamed = []
+    for name in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(name)
+        if ext not in (".css", ".js"):
+            continue
+        match = HASHED_NAME.match(name)
+        if match:
+            stem = match.group("stem")
+        path = os.path.join(directory, name)
+        hashed = f"{stem}.{content_hash(path)}{ext}"
+        if hashed != name:
+            os.replace(path, os.path.join(directory, hashed))
+            renamed.append((name, hashed))
+    return renamed
+
+
+def install(server):
+    @server.after_request
+    def cache_hashed_assets(response):
+        directory, _, name = flask.request.path.rpartition("/")
+        if (
+            response.status_code == 200
+            and directory.endswith("/assets")
+            and HASHED_NAME.match(name)
+        ):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = ONE_YEAR
+            response.cache_control.immutable = True
+        return response
+
+
+if __name__ == "__main__":
+    for old, new in fingerprint(sys.argv[1] if len(sys.argv) > 1 else ASSETS_DIR):
+        print(f"{old} -> {new}")
@@ -0,0 +1,152 @@
+import csv
+import os
+import re
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+
+#############################################################################
+# Readers for the wide JHU time series: four metadata columns, then one count
+# column per day. Both take a binary stream (a local file or an HTTP response)
+# and return the same frame, with the names as categoricals, float32 Lat/Long
+# and int32 counts (any single location's count fits; totals are summed as
+# int64). read_arrow parses with pyarrow's multithreaded CSV reader against a
+# schema declared from the header line, and is used unless CSV_ENGINE=pandas
+# (requirements.txt pins pyarrow; without it, read_pandas is used). With
+# `last`, only the metadata columns and the last `last` days are converted.
+#############################################################################
+
+timeseries_dtypes = defaultdict(
+    lambda: np.int32,
+    {
+        "Province/State": "category",
+        "Country/Region": "category",
+        "Lat": np.float32,
+        "Long": np.float32,
+    },
+)
+
+
+def read_header(stream):
+    return next(csv.reader([stream.readline().decode("utf-8-sig")]))
+
+
+def selected_columns(header, last=None):
+    if last is None:
+        return header
+    return header[:4] + header[max(4, len(header) - last) :]
+
+
+def read_pandas(stream, last=None):
+    header = read_header(stream)
+    return pd.read_csv(
+        stream,
+        header=None,
+        names=header,
+        usecols=selected_columns(header, last),
+        dtype=timeseries_dtypes,
+    )
+
+
+def read_arrow(stream, last=None):
+    header = read_header(stream)
+    names = pa.dictionary(pa.int32(), pa.string())
+    types = {name: pa.int32() for name in header[4:]}
+    types.update(dict(zip(header[:4], [names, names, pa.float32(), pa.float32()])))
+    table = pa_csv.read_csv(
+        stream,
+        read_options=pa_csv.ReadOptions(column_names=header),
+        # empty provinces are missing values, as pandas reads them
+        convert_options=pa_csv.ConvertOptions(
+            column_types=types,
+            include_columns=selected_columns(header, last),
+            strings_can_be_null=True,
+        ),
+    )
+    # the date columns land in one int32 block, whose to_numpy() is the
+    # locations x dates cube without another copy
+    df = table.to_pandas()
+    for name in header[:2]:
+        # pandas sorts the categories, arrow keeps them in order of appearance
+        df[name] = df[name].cat.reorder_categories(
+            df[name].cat.categories.sort_values()
+        )
+    return df
+
+
+#############################################################################
+# The US county files (time_series_covid19_*_US.csv) lay out one row per county
+# as UID, iso2, iso3, code3, FIPS, Admin2, Province_State, Country_Region,
+# Lat, Long_, Combined_Key (and Population in the deaths file) before the day
+# columns. read_us parses `chunksize` rows at a time, keeping only the names,
+# coordinates and counts, so memory is bounded by the converted frame rather
+# than the parser's string columns. The result has the layout of read(): a
+# county's "Province/State" is "Admin2, Province_State".
+#############################################################################
+
+us_columns = ["Admin2", "Province_State", "Country_Region", "Lat", "Long_"]
+us_dtypes = defaultdict(
+    lambda: np.int32,
+    {
+        "Admin2": str,
+        "Province_State": str,
+        "Country_Region": str,
+        "Lat": np.float32,
+        "Long_": np.float32,
+    },
+)
+date_column = re.compile(r"\d+/\d+/\d+$")
+
+
+def read_us(stream, last=None, chunksize=10000):
+    header = read_header(stream)
+    first_date = next(i for i, name in enumerate(header) if date_column.match(name))
+    date_columns = header[first_date:]
+    if last is not None:
+        date_columns = date_columns[-last:]
+    chunks = []
+    for chunk in pd.read_csv(
+        stream,
+        header=None,
+        names=header,
+        usecols=us_columns + date_columns,
+        dtype=us_dtypes,
+        chunksize=chunksize,
+    ):
+        county = chunk["Admin2"]
+        province = (county + ", " + chunk["Province_State"]).where(
+            county.notna(), chunk["Province_State"]
+        )
+        chunks.append(
+            pd.concat(
+                [
+                    pd.DataFrame(
+                        {
+                            "Province/State": province,
+                            "Country/Region": chunk["Country_Region"],
+                            "Lat": chunk["Lat"],
+                            "Long": chunk["Long_"],
+                        }
+                    ),
+                    chunk[date_columns],
+                ],
+                axis=1,
+            )
+        )
+    df = pd.concat(chunks, ignore_index=True)
+    for name in ("Province/State", "Country/Region"):
+        df[name] = df[name].astype("category")
+    return df
+
+
+if pa is not None and os.environ.get("CSV_ENGINE", "arrow") == "arrow":
+    read = read_arrow
+else:
+    read = read_pandas
@@ -0,0 +1,175 @@
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import flask
+
+import cache
+import metrics
+
+#############################################################################
+# Cache warm-up. Before a worker serves anyone (gunicorn.conf.py), the page
+# layout, every callback fired on page load and the map/line/bar figures of the
+# most requested locations are built through the normal Dash endpoint, so the
+# responses land in the response cache. Locations are ranked by how often users
+# selected them: every selection is counted, whether or not the cache answered
+# it, and the counts are merged into a JSON file shared by the workers and kept
+# across restarts, keyed by stable names rather than row positions.
+#############################################################################
+
+DASH_UPDATE_PATH = "/_dash-update-component"
+
+metrics.describe("cache_warmup_seconds", "Duration of each cache warm-up.")
+metrics.describe(
+    "cache_warmup_requests_total", "Callback requests replayed by cache warm-ups."
+)
+
+
+def output_spec(output):
+    # "id.prop" for one output, "..id.prop...id.prop.." for several
+    if output.startswith(".."):
+        return [
+            dict(zip(("id", "property"), o.rsplit(".", 1)))
+            for o in output[2:-2].split("...")
+        ]
+    return dict(zip(("id", "property"), output.rsplit(".", 1)))
+
+
+def initial_requests(dash_app, dependencies, values=None):
+    # The request body of every callback fired on page load, with the
+    # layout's initial values except for the "id.prop" overrides in `values`
+    values = values or {}
+    components = {
+        c.id: c for c in dash_app.layout._traverse() if getattr(c, "id", None)
+    }
+
+    def with_value(dependency):
+        name = f"{dependency['id']}.{dependency['property']}"
+        if name in values:
+            return dict(dependency, value=values[name])
+        component = components[dependency["id"]]
+        return dict(dependency, value=getattr(component, dependency["property"], None))
+
+    return [
+        {
+            "output": callback["output"],
+            "outputs": output_spec(callback["output"]),
+            "inputs": [with_value(i) for i in callback["inputs"]],
+            "state": [with_value(s) for s in callback["state"]],
+            "changedPropIds": [],
+        }
+        for callback in dependencies
+        if not callback["prevent_initial_call"]
+    ]
+
+
+def warm(dash_app, selection_input, selections, outputs=None):
+    # Build the default views, then every page-load callback reading
+    # `selection_input` ("id.prop") once per value in `selections`; only the
+    # callbacks whose output passes `outputs(output)` when given.
+    # Returns the callback request bodies it sent.
+    started = time.perf_counter()
+    client = dash_app.server.test_client()
+    # answered fresh, never from the previous data version
+    headers = {cache.REVALIDATE_HEADER: "1"}
+    client.get("/_dash-layout", headers=headers)
+    dependencies = client.get("/_dash-dependencies", headers=headers).get_json()
+    bodies = initial_requests(dash_app, dependencies)
+    component_id, prop = selection_input.rsplit(".", 1)
+    for value in selections:
+        bodies += [
+            body
+            for body in initial_requests(
+                dash_app, dependencies, {selection_input: value}
+            )
+            if {"id": component_id, "property": prop, "value": value} in body["inputs"]
+        ]
+    if outputs is not None:
+        bodies = [body for body in bodies if outputs(body["output"])]
+    for body in bodies:
+        client.post(DASH_UPDATE_PATH, json=body, headers=headers)
+    metrics.increment("cache_warmup_requests_total", len(bodies))
+    metrics.observe("cache_warmup_seconds", time.perf_counter() - started)
+    return bodies
+
+
+class SelectionCounts:
+    # How often each selection was requested. New counts are merged into the
+    # file at most every `flush_every` seconds and at exit; two workers
+    # flushing at the same moment may lose one of their batches.
+    def __init__(self, path, flush_every=60):
+        self.path = path
+        self.flush_every = flush_every
+        self._pending = Counter()
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return Counter(json.load(f))
+        except (OSError, ValueError):
+            return Counter()
+
+    def record(self, name):
+        with self._lock:
+            self._pending[name] += 1
+            due = time.monotonic() - self._flushed_at > self.flush_every
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._flushed_at = time.monotonic()
+        if not pending:
+            return
+        counts = self.load() + pending
+        try:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(counts, f)
+            os.replace(tmp, self.path)
+        except OSError:
+            # counting is best effort, keep serving
+            pass
+
+    def top(self, n):
+        with self._lock:
+            pending = Counter(self._pending)
+        return [name for name, _ in (self.load() + pending).most_common(n)]
+
+    def install(self, server, selection_input, name_of, output):
+        # Count the first selected value of `selection_input` in the requests
+        # of the callback drawing `output` ("id.prop"), as name_of(value):
+        # one selection fires every callback reading the input, and is
+        # counted once. Must run before the response cache, which answers
+        # hits without running later hooks.
+        component_id, prop = selection_input.rsplit(".", 1)
+
+        @server.before_request
+        def count_selection():
+            if not flask.request.path.endswith(DASH_UPDATE_PATH) or (
+                flask.request.headers.get(cache.REVALIDATE_HEADER)
+            ):
+                return None
+            body = flask.request.get_json(silent=True) or {}
+            if body.get("output") != output:
+                return None
+            for dependency in body.get("inputs", []):
+                if (
+                    isinstance(dependency, dict)
+                    and dependency.get("id") == component_id
+                    and dependency.get("property") == prop
+                    and dependency.get("value")
+                ):
+                    name = name_of(dependency["value"][0])
+                    if name is not None:
+                        self.record(name)
+            return None